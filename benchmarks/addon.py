@@ -0,0 +1,65 @@
+"""
+Helpers for running the add-on in benchmarks. Inside Blender the real bpy is
+used, anywhere else the stand-ins in benchmarks/stubs are.
+"""
+import importlib.util
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+stubs = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+
+def in_blender():
+    try:
+        import bpy
+    except ImportError:
+        return False
+    return not getattr(bpy, "__file__", "").startswith(stubs)
+
+def use_stubs():
+    if not in_blender() and stubs not in sys.path:
+        sys.path.insert(0, stubs)
+
+def load_addon(name="renderchan_io", source=None):
+    """Import the add-on from source, by default the working tree's src directory"""
+    source = source or os.path.join(root, "src")
+    use_stubs()
+    for module in list(sys.modules):
+        if module == name or module.startswith(name + "."):
+            del sys.modules[module]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(source, "__init__.py"), \
+        submodule_search_locations=[source])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[name] = addon
+    spec.loader.exec_module(addon)
+    return addon
+
+def scene_options(**options):
+    """Stand-in for a scene's RenderOptions with their defaults"""
+    defaults = {"profile": "default", "stereo": "none", "render_farm": "none", "cgru_location": "/opt/cgru", \
+        "workers": 4, "log_output": False, "profiling": False, "watch": False, "preview": False, "preview_profile": "default", \
+        "cache_size": 20}
+    defaults.update(options)
+    return SimpleNamespace(**defaults)
+
+def timings(function, repeat=5):
+    """Best, median and mean wall clock time of function() in seconds"""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"best": times[0], "median": times[len(times) // 2], "mean": sum(times) / len(times), "repeat": repeat}
+
+def timed(function, repeat=5):
+    """Best wall clock time of function() in seconds"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
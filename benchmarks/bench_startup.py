@@ -0,0 +1,92 @@
+"""
+Measure what the add-on costs at Blender startup: importing it, register()
+and the load handler for a file outside of any RenderChan project, compared
+with the first load of a file inside one. The fake RenderChan is given a
+startup cost standing in for loading its modules and templates.
+
+    python benchmarks/bench_startup.py [--rev GIT_REVISION] [--renderchan-cost SECONDS]
+
+With --rev the add-on is also measured as it was at that revision, so the
+cost before and after a change can be compared. Every measurement runs in a
+fresh interpreter.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from addon import load_addon, root, scene_options, use_stubs
+
+def measure(source, renderchan_cost):
+    use_stubs()
+    import renderchan.core
+    renderchan.core.RenderChan.startup_cost = renderchan_cost
+    result = {}
+
+    start = time.perf_counter()
+    addon = load_addon(source=source)
+    result["import"] = time.perf_counter() - start
+
+    import bpy
+    start = time.perf_counter()
+    addon.register()
+    result["register"] = time.perf_counter() - start
+
+    scene = bpy.types.Scene()
+    scene.renderchan = scene_options()
+    bpy.context.scene = scene
+    directory = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(directory, "plain"))
+        os.makedirs(os.path.join(directory, "project"))
+        open(os.path.join(directory, "project", "project.conf"), "w").close()
+        for name in ("plain", "project"):
+            bpy.data.filepath = os.path.join(directory, name, "shot.blend")
+            open(bpy.data.filepath, "w").close()
+            start = time.perf_counter()
+            try:
+                addon.load_handler(None)
+            except Exception as e:
+                # Older revisions may need more of Blender than the stubs provide
+                result["load_%s_error" % name] = str(e)
+            result["load_%s" % name] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+    result["startup"] = result["import"] + result["register"] + result["load_plain"]
+    return result
+
+def run_child(source, renderchan_cost):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", source, \
+        "--renderchan-cost", str(renderchan_cost)], universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the add-on's startup cost.")
+    parser.add_argument("--rev", help="Git revision to compare the working tree with")
+    parser.add_argument("--renderchan-cost", type=float, default=0.25, help="Seconds the fake RenderChan takes to construct")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.child:
+        print(json.dumps(measure(arguments.child, arguments.renderchan_cost)))
+        return
+
+    results = {"renderchan_cost": arguments.renderchan_cost, "working_tree": run_child(os.path.join(root, "src"), arguments.renderchan_cost)}
+    if arguments.rev:
+        directory = tempfile.mkdtemp()
+        try:
+            archive = subprocess.check_output(["git", "-C", root, "archive", arguments.rev, "src"])
+            subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+            results[arguments.rev] = run_child(os.path.join(directory, "src"), arguments.renderchan_cost)
+        finally:
+            shutil.rmtree(directory)
+    json.dump(results, sys.stdout, indent=1, sort_keys=True)
+    print()
+
+if __name__ == "__main__":
+    main()
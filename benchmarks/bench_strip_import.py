@@ -0,0 +1,62 @@
+"""
+Compare building an image strip for a rendered frame sequence the old way,
+one dict per frame handed to bpy.ops.sequencer.image_strip_add, with
+scan_frames() and add_image_sequence().
+
+    python benchmarks/bench_strip_import.py [frames ...]
+    blender -b --python benchmarks/bench_strip_import.py -- [frames ...]
+
+Only runs inside Blender compare the two. Outside of it the operator is a
+stand-in that costs next to nothing per frame, so the old loop comes out
+ahead there and the numbers say nothing about Blender.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from addon import in_blender, load_addon, timed
+
+def old_import(bpy, directory, start, end, extension):
+    file_list = []
+    for i in range(start, end):
+        file_list.append({"name": "file.%05d.%s" % (i, extension)})
+    bpy.ops.sequencer.image_strip_add(directory=directory, files=file_list, relative_path=True, frame_start=1, channel=1, replace_sel=True)
+
+def clear(bpy):
+    if in_blender() and bpy.context.scene.sequence_editor:
+        for strip in list(bpy.context.scene.sequence_editor.sequences):
+            bpy.context.scene.sequence_editor.sequences.remove(strip)
+
+def new_import(addon, bpy, directory, extension):
+    scene = bpy.context.scene if in_blender() else bpy.types.Scene()
+    frames = addon.scan_frames(directory, extension)
+    addon.add_image_sequence(scene, frames, 1, 1)
+
+def main(counts):
+    addon = load_addon()
+    import bpy
+    if not in_blender():
+        print("Not running in Blender, the operator loop is not timed with Blender's costs", file=sys.stderr)
+    results = []
+    for count in counts:
+        directory = tempfile.mkdtemp()
+        try:
+            for i in range(1, count + 1):
+                open(os.path.join(directory, "file.%05d.png" % i), "w").close()
+            results.append({
+                "frames": count,
+                "blender": in_blender(),
+                "operator_loop": timed(lambda: (clear(bpy), old_import(bpy, directory, 1, count + 1, "png"))),
+                "scan_and_data_api": timed(lambda: (clear(bpy), new_import(addon, bpy, directory, "png")))
+            })
+        finally:
+            shutil.rmtree(directory)
+    json.dump(results, sys.stdout, indent=1)
+    print()
+
+if __name__ == "__main__":
+    arguments = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    main([int(count) for count in arguments] or [1000, 10000])
@@ -0,0 +1,118 @@
+"""
+Check that RenderChanSession carries nothing over between calls. Every
+dependency parse of the reused session has to give the same answer as a
+fresh RenderChan instance, and once reset, its state has to match the fresh
+instance's, the parsed projects and loaded modules included.
+
+    python benchmarks/check_session.py [--renderchan DIRECTORY] [--strips N] [FILE ...]
+
+By default the files of a synthetic project are parsed with the stand-ins in
+benchmarks/stubs. With --renderchan the RenderChan in DIRECTORY is used, give
+it the files of a real project as well. Differences are listed and the exit
+status is 1.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from addon import load_addon, use_stubs
+from run import make_project
+
+# How deep snapshot() follows attributes and items
+max_depth = 8
+
+def snapshot(value, path="main", state=None, parents=()):
+    """Flattens value into a dict of attribute paths to plain values, to compare two instances"""
+    state = {} if state is None else state
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        state[path] = value
+    elif id(value) in parents:
+        state[path] = "<cycle>"
+    elif len(parents) >= max_depth or isinstance(value, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+        state[path] = type(value).__name__
+    elif isinstance(value, dict):
+        state[path] = "dict of %d" % len(value)
+        for key, item in value.items():
+            snapshot(item, "%s[%r]" % (path, key), state, parents + (id(value),))
+    elif isinstance(value, (list, tuple)):
+        state[path] = "%s of %d" % (type(value).__name__, len(value))
+        for i, item in enumerate(value):
+            snapshot(item, "%s[%d]" % (path, i), state, parents + (id(value),))
+    elif isinstance(value, (set, frozenset)):
+        state[path] = sorted([repr(item) if isinstance(item, (int, float, str, bytes, tuple)) else type(item).__name__ for item in value])
+    elif hasattr(value, "__dict__"):
+        state[path] = type(value).__name__
+        for name, item in vars(value).items():
+            snapshot(item, "%s.%s" % (path, name), state, parents + (id(value),))
+    else:
+        state[path] = type(value).__name__
+    return state
+
+def differences(expected, found):
+    lines = []
+    for path in sorted(set(expected) | set(found)):
+        if path not in found:
+            lines.append("%s is missing" % path)
+        elif path not in expected:
+            lines.append("%s = %r was left behind" % (path, found[path]))
+        elif expected[path] != found[path]:
+            lines.append("%s = %r, a fresh instance has %r" % (path, found[path], expected[path]))
+    return lines
+
+def check(addon, files, profiles):
+    """Parse files with every profile in turn, returns the differences found"""
+    from renderchan.file import RenderChanFile
+    session = addon.RenderChanSession()
+    failures = []
+    for profile in profiles:
+        options = {"profile": profile, "stereo": "none", "render_farm": "none", "cgru_location": ""}
+        for path in files:
+            fresh = addon.RenderChanSession()
+            with addon.quiet():
+                found = session.parse_direct_dependency(RenderChanFile(path, session.main.modules, session.main.projects), options)
+                expected = fresh.parse_direct_dependency(RenderChanFile(path, fresh.main.modules, fresh.main.projects), options)
+            if bool(found[0]) != bool(expected[0]):
+                failures.append("%s with profile %s: the session says %s, a fresh instance %s" % \
+                    (path, profile, "dirty" if found[0] else "clean", "dirty" if expected[0] else "clean"))
+            session.reset()
+            fresh.reset()
+            for line in differences(snapshot(fresh.main), snapshot(session.main)):
+                failures.append("%s with profile %s: %s" % (path, profile, line))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the reused RenderChan session matches a fresh one.")
+    parser.add_argument("files", nargs="*", help="Files to parse, by default those of a synthetic project")
+    parser.add_argument("--renderchan", help="Directory of the RenderChan to check instead of the stand-in")
+    parser.add_argument("--profiles", nargs="+", default=["default", "profile1", "profile0", "default"], \
+        help="Profiles to parse with, in this order")
+    parser.add_argument("--strips", type=int, default=10, help="Shots in the synthetic project")
+    arguments = parser.parse_args()
+
+    use_stubs()
+    if arguments.renderchan:
+        sys.path.insert(0, os.path.abspath(arguments.renderchan))
+    addon = load_addon()
+    addon.register()
+    directory = None
+    try:
+        files = [os.path.abspath(path) for path in arguments.files]
+        if not files:
+            directory = tempfile.mkdtemp()
+            shots, art = make_project(directory, arguments.strips // 2, arguments.strips, 2, 2)
+            files = [source for source, output in shots + art]
+        failures = check(addon, files, arguments.profiles)
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+    for line in failures:
+        print(line)
+    print("%d files, %d profiles: %s" % (len(files), len(arguments.profiles), "%d differences" % len(failures) if failures else "ok"))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Time the add-on's hot paths on a synthetic RenderChan project, without
+Blender: the panel polls, profile_items(), RCRefreshSequence's traversal,
+RenderChanSequenceAdd's strip building and refresh_everything(). Results are
+printed as JSON, so they can be kept and compared between revisions.
+
+    python benchmarks/run.py [--images N] [--strips N] [--frames N] [--meta-depth N] [--output FILE]
+
+"cold" timings are taken with the add-on's caches cleared, as after opening
+a file. Everything runs against the stand-ins in benchmarks/stubs, so the
+numbers are the cost of the add-on's own Python, not of Blender's.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from addon import load_addon, root, scene_options, timings, use_stubs
+
+def make_project(directory, images, strips, frames, profiles):
+    """
+    A project with a background every shot depends on, strips of shots
+    rendered to frame sequences and images of artwork rendered to single
+    files, all rendered already.
+    """
+    with open(os.path.join(directory, "project.conf"), "w") as f:
+        for i in range(profiles):
+            f.write("[profile%d]\nWIDTH=%d\n\n" % (i, 480 * (i + 1)))
+    render = os.path.join(directory, "render")
+    for name in ("shots", "art", "textures"):
+        os.makedirs(os.path.join(directory, name))
+    with open(os.path.join(directory, "bg.svg"), "w") as f:
+        f.write("<svg/>\n")
+    os.makedirs(render)
+    open(os.path.join(render, "bg.svg.png"), "w").close()
+
+    shots = []
+    for i in range(strips):
+        source = os.path.join(directory, "shots", "shot%04d.sifz" % i)
+        with open(source, "w") as f:
+            f.write("depends ../bg.svg\n")
+        output = os.path.join(render, "shots", "shot%04d.sifz.png" % i)
+        os.makedirs(output)
+        for frame in range(1, frames + 1):
+            open(os.path.join(output, "file.%05d.png" % frame), "w").close()
+        shots.append((source, output))
+
+    art = []
+    for i in range(images):
+        source = os.path.join(directory, "art", "art%04d.kra" % i)
+        with open(source, "w") as f:
+            f.write("depends ../bg.svg\n")
+        output = os.path.join(render, "art", "art%04d.kra.png" % i)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        open(output, "w").close()
+        art.append((source, output))
+    # Images that have nothing to do with RenderChan
+    for i in range(max(1, images // 4)):
+        open(os.path.join(directory, "textures", "texture%04d.png" % i), "w").close()
+
+    open(os.path.join(directory, "edit.blend"), "w").close()
+    return shots, art
+
+def build_scene(bpy, directory, shots, art, frames, meta_depth, meta_size):
+    scene = bpy.types.Scene()
+    scene.renderchan = scene_options()
+    editor = scene.sequence_editor_create()
+    strips = []
+    for i, (source, output) in enumerate(shots):
+        strip = bpy.types.ImageSequence("shot%04d" % i, output + os.sep, 1 + i % 8, 1 + i * frames)
+        for frame in range(1, frames + 1):
+            strip.elements.append("file.%05d.png" % frame)
+        strips.append(strip)
+    # Wrap groups of strips in nested meta strips
+    top = []
+    for start in range(0, len(strips), meta_size if meta_depth else len(strips) or 1):
+        group = strips[start:start + meta_size] if meta_depth else strips[start:]
+        for level in range(meta_depth):
+            meta = bpy.types.MetaSequence("meta%04d.%d" % (start, level))
+            meta.sequences = group
+            group = [meta]
+        top += group
+    # Strips of images that have nothing to do with RenderChan
+    plain = []
+    for i, name in enumerate(sorted(os.listdir(os.path.join(directory, "textures")))):
+        strip = bpy.types.ImageSequence("texture%04d" % i, os.path.join(directory, "textures", ""), 9)
+        strip.elements.append(name)
+        plain.append(strip)
+    editor.sequences.extend(plain + top)
+
+    del bpy.data.images[:]
+    for i, (source, output) in enumerate(art):
+        bpy.data.images.append(bpy.types.Image("art%04d" % i, output))
+    for name in sorted(os.listdir(os.path.join(directory, "textures"))):
+        bpy.data.images.append(bpy.types.Image(name, os.path.join(directory, "textures", name)))
+    del bpy.data.scenes[:]
+    bpy.data.scenes.append(scene)
+    return scene, top, plain
+
+def clear_caches(addon):
+    """Forget everything the add-on learned, like after opening a file"""
+    addon.rcl._files = None
+    addon.rcl.manifests = {}
+    addon.rcl.stores = {}
+    addon.rcl.items = {}
+
+def run(arguments):
+    use_stubs()
+    addon = load_addon()
+    import bpy
+    addon.register()
+    results = {}
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        shots, art = make_project(directory, arguments.images, arguments.strips, arguments.frames, arguments.profiles)
+        setup = time.perf_counter() - start
+        bpy.data.filepath = os.path.join(directory, "edit.blend")
+        scene, top, plain = build_scene(bpy, directory, shots, art, arguments.frames, arguments.meta_depth, arguments.meta_size)
+        bpy.context.scene = scene
+        rcl = addon.rcl
+        rcl.blend = addon.resolve_file(bpy.data.filepath).file
+        rcl.is_project = True
+        # Everything is rendered and recorded, so nothing gets queued
+        options = addon.job_options(scene)
+        for source, output in shots + art:
+            addon.render_recorder(source, options)(None)
+        repeat = arguments.repeat
+
+        context = bpy.context
+        context.edit_image = bpy.data.images[0]
+        def cold(function):
+            def call():
+                clear_caches(addon)
+                function()
+            return call
+
+        image_poll = lambda: addon.ImageEditorPanel.poll(context)
+        # Strips that aren't RenderChan's come first, so the poll has to look at all of them
+        context.selected_sequences = plain + top
+        sequence_poll = lambda: addon.SequenceEditorPanel.poll(context)
+        results["image_panel_poll"] = timings(image_poll, repeat * 20)
+        results["image_panel_poll_cold"] = timings(cold(image_poll), repeat)
+        results["sequence_panel_poll"] = timings(sequence_poll, repeat * 20)
+        results["sequence_panel_poll_cold"] = timings(cold(sequence_poll), repeat)
+        context.edit_image = bpy.data.images[-1]
+        results["image_panel_poll_other"] = timings(image_poll, repeat * 20)
+        context.selected_sequences = plain
+        results["sequence_panel_poll_other"] = timings(sequence_poll, repeat * 20)
+        context.selected_sequences = top
+
+        profiles = lambda: addon.profile_items(scene, context)
+        results["profile_items"] = timings(profiles, repeat * 20)
+        results["profile_items_cold"] = timings(cold(profiles), repeat)
+
+        refresh = addon.RCRefreshSequence()
+        def refresh_sequence():
+            refresh.execute(context)
+            rcl.jobs.clear()
+        results["sequence_files"] = timings(lambda: [addon.sequence_files(strip) for strip in top], repeat)
+        results["refresh_sequence"] = timings(refresh_sequence, repeat)
+        results["refresh_sequence_cold"] = timings(cold(refresh_sequence), repeat)
+
+        add = addon.RenderChanSequenceAdd()
+        add.filepath = shots[0][0]
+        add.files = []
+        add.rel_path = True
+        add.start = 1
+        add.channel = 1
+        add.replace = True
+        add.sound = False
+        add.cache = False
+        add_scene = bpy.types.Scene("Add")
+        add_scene.renderchan = scene_options()
+        def sequence_add():
+            add_scene.sequence_editor = None
+            context.scene = add_scene
+            try:
+                add.execute(context)
+            finally:
+                context.scene = scene
+        results["sequence_add"] = timings(sequence_add, repeat)
+
+        results["refresh_everything"] = timings(lambda: addon.refresh_everything(), repeat)
+        results["output_stamps"] = timings(addon.output_stamps, repeat)
+        stamps = addon.output_stamps()
+        results["refresh_unchanged"] = timings(lambda: addon.refresh_everything(stamps), repeat)
+        def refresh_one_changed():
+            os.utime(art[0][1], (time.time(), time.time() + 1))
+            addon.refresh_everything(stamps)
+        results["refresh_one_changed"] = timings(refresh_one_changed, repeat)
+
+        return {
+            "config": vars(arguments),
+            "setup_seconds": setup,
+            "python": platform.python_version(),
+            "revision": revision(),
+            "time": time.time(),
+            "results": results
+        }
+    finally:
+        shutil.rmtree(directory)
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "-C", root, "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, \
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the add-on's hot paths on a synthetic project.")
+    parser.add_argument("--images", type=int, default=200, help="Images rendered from RenderChan sources")
+    parser.add_argument("--strips", type=int, default=100, help="Image strips of rendered frame sequences")
+    parser.add_argument("--frames", type=int, default=100, help="Frames per strip")
+    parser.add_argument("--meta-depth", type=int, default=2, help="How deeply strips are nested in meta strips")
+    parser.add_argument("--meta-size", type=int, default=10, help="Strips per innermost meta strip")
+    parser.add_argument("--profiles", type=int, default=8, help="Profiles in project.conf")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    parser.add_argument("--output", help="Append the results as a JSON line to this file")
+    arguments = parser.parse_args()
+
+    report = run(arguments)
+    json.dump(report, sys.stdout, indent=1, sort_keys=True)
+    print()
+    if arguments.output:
+        with open(arguments.output, "a") as f:
+            f.write(json.dumps(report, sort_keys=True) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Just enough of Blender's bpy module to import the add-on and run its hot
+paths outside of Blender. Collections are plain Python objects, so timings
+show the cost of the add-on's own code rather than of Blender's.
+"""
+from . import app, ops, path, props, types, utils
+
+class Collection(list):
+    def get(self, name, default=None):
+        for item in self:
+            if getattr(item, "name", None) == name:
+                return item
+        return default
+
+class Data():
+    def __init__(self):
+        self.filepath = ""
+        self.images = Collection()
+        self.movieclips = Collection()
+        self.scenes = Collection()
+        self.texts = Collection()
+
+class Context():
+    def __init__(self):
+        self.scene = None
+        self.window = None
+        self.window_manager = types.WindowManager()
+        self.edit_image = None
+        self.selected_sequences = []
+        self.area = None
+
+    @property
+    def blend_data(self):
+        return data
+
+data = Data()
+context = Context()
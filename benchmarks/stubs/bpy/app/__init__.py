@@ -0,0 +1,7 @@
+import sys
+
+binary_path = sys.executable
+binary_path_python = sys.executable
+background = False
+version = (2, 76, 0)
+tempdir = ""
@@ -0,0 +1,5 @@
+load_post = []
+save_post = []
+
+def persistent(function):
+    return function
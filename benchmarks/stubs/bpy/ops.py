@@ -0,0 +1,31 @@
+class Operator():
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        # Like RNA, walk the collections handed to the operator
+        for value in kwargs.values():
+            if isinstance(value, list):
+                for item in value:
+                    dict(item)
+        return {"FINISHED"}
+
+class Namespace():
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, name):
+        operator = Operator("%s.%s" % (self.name, name))
+        setattr(self, name, operator)
+        return operator
+
+class Ops():
+    def __getattr__(self, name):
+        namespace = Namespace(name)
+        setattr(self, name, namespace)
+        return namespace
+
+import sys
+sys.modules[__name__] = Ops()
@@ -0,0 +1,17 @@
+import os
+
+extensions_movie = frozenset([".avi", ".mov", ".mp4", ".mkv", ".ogv", ".webm"])
+extensions_image = frozenset([".png", ".jpg", ".jpeg", ".exr", ".tif", ".tiff"])
+extensions_audio = frozenset([".wav", ".ogg", ".flac", ".mp3"])
+
+def abspath(path):
+    if path.startswith("//"):
+        import bpy
+        return os.path.join(os.path.dirname(bpy.data.filepath), path[2:])
+    return path
+
+def relpath(path):
+    import bpy
+    if not bpy.data.filepath:
+        return path
+    return "//" + os.path.relpath(path, os.path.dirname(bpy.data.filepath))
@@ -0,0 +1,15 @@
+def _property(kind):
+    def define(**kwargs):
+        return (kind, kwargs)
+    define.__name__ = kind
+    return define
+
+BoolProperty = _property("BoolProperty")
+IntProperty = _property("IntProperty")
+FloatProperty = _property("FloatProperty")
+StringProperty = _property("StringProperty")
+EnumProperty = _property("EnumProperty")
+PointerProperty = _property("PointerProperty")
+CollectionProperty = _property("CollectionProperty")
+
+__all__ = ["BoolProperty", "IntProperty", "FloatProperty", "StringProperty", "EnumProperty", "PointerProperty", "CollectionProperty"]
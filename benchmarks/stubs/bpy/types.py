@@ -0,0 +1,160 @@
+class Operator():
+    @property
+    def properties(self):
+        return self
+
+    def report(self, kind, message):
+        pass
+
+class Panel():
+    pass
+
+class PropertyGroup():
+    pass
+
+class AddonPreferences():
+    pass
+
+class OperatorFileListElement():
+    pass
+
+class WindowManager():
+    def __init__(self):
+        self.windows = []
+
+    def event_timer_add(self, time_step, window=None):
+        return object()
+
+    def event_timer_remove(self, timer):
+        pass
+
+    def modal_handler_add(self, operator):
+        pass
+
+    def progress_begin(self, low, high):
+        pass
+
+    def progress_update(self, value):
+        pass
+
+    def progress_end(self):
+        pass
+
+class Menu():
+    draw_functions = []
+
+    @classmethod
+    def append(cls, function):
+        cls.draw_functions.append(function)
+
+    @classmethod
+    def remove(cls, function):
+        cls.draw_functions.remove(function)
+
+class RENDER_PT_render(Menu):
+    draw_functions = []
+
+class SEQUENCER_MT_add(Menu):
+    draw_functions = []
+
+class INFO_MT_file_import(Menu):
+    draw_functions = []
+
+class Image():
+    def __init__(self, name, filepath, source="FILE"):
+        self.name = name
+        self.filepath = filepath
+        self.source = source
+        self.packed_file = None
+        self.reloads = 0
+
+    def reload(self):
+        self.reloads += 1
+
+class Scene():
+    def __init__(self, name="Scene"):
+        self.name = name
+        self.sequence_editor = None
+        self.frame_current = 1
+
+    def sequence_editor_create(self):
+        self.sequence_editor = SequenceEditor()
+        return self.sequence_editor
+
+class SequenceElement():
+    def __init__(self, filename):
+        self.filename = filename
+
+class SequenceElements(list):
+    def append(self, filename):
+        element = SequenceElement(filename)
+        list.append(self, element)
+        return element
+
+class Sequence():
+    type = None
+
+    def __init__(self, name, channel=1, frame_start=1):
+        self.name = name
+        self.channel = channel
+        self.frame_start = frame_start
+        self.select = False
+
+class ImageSequence(Sequence):
+    type = "IMAGE"
+
+    def __init__(self, name, directory, channel=1, frame_start=1):
+        Sequence.__init__(self, name, channel, frame_start)
+        self.directory = directory
+        self.elements = SequenceElements()
+
+class MovieSequence(Sequence):
+    type = "MOVIE"
+
+    def __init__(self, name, filepath, channel=1, frame_start=1):
+        Sequence.__init__(self, name, channel, frame_start)
+        self.filepath = filepath
+
+class SoundSequence(MovieSequence):
+    type = "SOUND"
+
+class MetaSequence(Sequence):
+    type = "META"
+
+    def __init__(self, name, channel=1, frame_start=1):
+        Sequence.__init__(self, name, channel, frame_start)
+        self.sequences = []
+
+class Sequences(list):
+    def new_image(self, name, filepath, channel, frame_start):
+        import os
+        strip = ImageSequence(name, os.path.join(os.path.dirname(filepath), ""), channel, frame_start)
+        strip.elements.append(os.path.basename(filepath))
+        self.append(strip)
+        return strip
+
+    def new_movie(self, name, filepath, channel, frame_start):
+        strip = MovieSequence(name, filepath, channel, frame_start)
+        self.append(strip)
+        return strip
+
+    def new_sound(self, name, filepath, channel, frame_start):
+        strip = SoundSequence(name, filepath, channel, frame_start)
+        self.append(strip)
+        return strip
+
+class SequenceEditor():
+    def __init__(self):
+        self.sequences = Sequences()
+        self.active_strip = None
+
+    @property
+    def sequences_all(self):
+        found = []
+        pending = list(self.sequences)
+        while pending:
+            sequence = pending.pop(0)
+            found.append(sequence)
+            if sequence.type == "META":
+                pending += sequence.sequences
+        return found
@@ -0,0 +1,7 @@
+registered = []
+
+def register_class(cls):
+    registered.append(cls)
+
+def unregister_class(cls):
+    registered.remove(cls)
@@ -0,0 +1,5 @@
+class ImportHelper():
+    filepath = ""
+
+    def invoke(self, context, event):
+        return {"RUNNING_MODAL"}
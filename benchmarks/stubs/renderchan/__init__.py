@@ -0,0 +1,6 @@
+"""
+A fake RenderChan with the same surface the add-on uses. Projects are
+directories containing a project.conf. Sources are recognised by their
+extension, and each line of a source reading "depends <path>" declares a
+dependency relative to the source.
+"""
@@ -0,0 +1,60 @@
+import os
+
+class RenderChanModuleManager():
+    # Extension of the source, output format and whether the output is a frame sequence
+    formats = {".sifz": ("png", True), ".kra": ("png", False), ".blend": ("png", True), ".svg": ("png", False)}
+
+    def get(self, extension):
+        return self.formats.get(extension)
+
+class RenderChanProject():
+    def __init__(self, path):
+        self.path = path
+        self.confPath = os.path.join(path, "project.conf")
+
+class RenderChanProjectManager():
+    def __init__(self):
+        self.list = {}
+        self.profile = None
+
+    def get(self, path):
+        if path not in self.list:
+            self.list[path] = RenderChanProject(path)
+        return self.list[path]
+
+class RenderChan():
+    # Seconds of work to simulate when constructed, loading modules and templates
+    startup_cost = 0.0
+
+    def __init__(self):
+        if RenderChan.startup_cost:
+            import time
+            time.sleep(RenderChan.startup_cost)
+        self.datadir = None
+        self.projects = RenderChanProjectManager()
+        self.modules = RenderChanModuleManager()
+        self.loadedFiles = {}
+        self.trackedFiles = {}
+        self.trackedFilesStack = []
+        self.renderfarm_engine = ""
+        self.cgru_location = "/opt/cgru"
+        self.force = False
+        print("RenderChan initialized.")
+
+    def setProfile(self, profile):
+        self.projects.profile = profile
+
+    def submit(self, taskfile, dependenciesOnly=False, allocateOnly=False, stereo=""):
+        self.trackedFiles[taskfile.getPath()] = taskfile
+        return True
+
+    def parseDirectDependency(self, taskfile, compare_time, ignore_check=False):
+        self.loadedFiles[taskfile.getPath()] = taskfile
+        dirty = False
+        for dependency in taskfile.getDependencies():
+            from renderchan.file import RenderChanFile
+            file = RenderChanFile(dependency, self.modules, self.projects)
+            render_path = file.getRenderPath()
+            if file.module and (not os.path.exists(render_path) or os.path.getmtime(dependency) > os.path.getmtime(render_path)):
+                dirty = True
+        return (dirty, [], 0)
@@ -0,0 +1,64 @@
+import os
+
+def find_project(path):
+    directory = os.path.dirname(path)
+    while True:
+        if os.path.exists(os.path.join(directory, "project.conf")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+class RenderChanFile():
+    # How many RenderChanFile objects were made, for benchmarks
+    constructed = 0
+
+    def __init__(self, path, modules, projects):
+        RenderChanFile.constructed += 1
+        self.projectPath = find_project(path)
+        self.project = projects.get(self.projectPath) if self.projectPath else None
+        self.module = None
+        self.path = path
+        self.dependencies = None
+        if self.project is None:
+            return
+        render_root = os.path.join(self.projectPath, "render")
+        if path.startswith(render_root + os.sep):
+            # A render output, find the source it came from
+            parts = os.path.relpath(path, render_root).split(os.sep)
+            for i in range(len(parts)):
+                candidate = os.path.splitext(os.path.join(*parts[:i + 1]))[0]
+                if modules.get(os.path.splitext(candidate)[1]):
+                    self.path = os.path.join(self.projectPath, candidate)
+                    break
+            else:
+                return
+        self.format = modules.get(os.path.splitext(self.path)[1])
+        if self.format:
+            self.module = os.path.splitext(self.path)[1][1:]
+
+    def getPath(self):
+        return self.path
+
+    def getRenderPath(self):
+        relative = os.path.relpath(self.path, self.projectPath)
+        return os.path.join(self.projectPath, "render", relative + "." + self.format[0])
+
+    def getFormat(self):
+        return self.format[0]
+
+    def getStartFrame(self):
+        return 1
+
+    def getEndFrame(self):
+        return 1 + len(os.listdir(self.getRenderPath())) if os.path.isdir(self.getRenderPath()) else 2
+
+    def getDependencies(self):
+        if self.dependencies is None:
+            self.dependencies = []
+            with open(self.path, errors="replace") as f:
+                for line in f:
+                    if line.startswith("depends "):
+                        self.dependencies.append(os.path.normpath(os.path.join(os.path.dirname(self.path), line[8:].strip())))
+        return self.dependencies
@@ -0,0 +1,5 @@
+import io
+
+def ini_wrapper(path):
+    with open(path) as f:
+        return io.StringIO("[default]\n" + f.read())
@@ -6,27 +6,71 @@ import subprocess
 import os.path
 from bpy.props import *
 from shutil import which
-from contextlib import redirect_stdout
-import io
+from collections import OrderedDict
+import copy
+import hashlib
+import re
 import sys
-# Add blender to PATH if its not already on there
-if not which("blender"):
-    os.environ["PATH"] += os.pathsep + os.path.dirname(bpy.app.binary_path)
-# Use renderchan on path if it exists, fallback on packaged version
-renderchan_exec_path = which("renderchan")
-if renderchan_exec_path:
-    module_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(renderchan_exec_path))))
-    if os.path.exists(os.path.join(module_path, 'renderchan', '__init__.py')):
-        sys.path.append(module_path)
-    else:
-        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan"))
-else:
-    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan"))
-
-import renderchan
-from renderchan.core import RenderChan
 import importlib
-importlib.reload(renderchan)
+from . import capture, farm, index, jobs, profiling, watch
+importlib.reload(capture)
+importlib.reload(index)
+importlib.reload(jobs)
+importlib.reload(farm)
+importlib.reload(profiling)
+importlib.reload(watch)
+from .capture import quiet
+from .index import output_stamp
+from .profiling import profiler, profiled
+import tempfile
+import time
+
+# Command used to run RenderChan in the background, filled in by setup_renderchan()
+renderchan_command = []
+renderchan_ready = False
+
+def setup_renderchan():
+    """
+    Find and import RenderChan. This is put off until a RenderChan project is
+    opened or an operator needs it, so Blender starts just as fast for everyone
+    who never touches a RenderChan project.
+    """
+    global renderchan_ready
+    if renderchan_ready:
+        return
+    with profiler.phase("setup_renderchan"):
+        # Add blender to PATH if its not already on there
+        if not which("blender"):
+            os.environ["PATH"] += os.pathsep + os.path.dirname(bpy.app.binary_path)
+        # Use renderchan on path if it exists, fallback on packaged version
+        renderchan_exec_path = which("renderchan")
+        if renderchan_exec_path:
+            module_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(renderchan_exec_path))))
+            if os.path.exists(os.path.join(module_path, 'renderchan', '__init__.py')):
+                sys.path.append(module_path)
+            else:
+                sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan"))
+        else:
+            sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan"))
+        if renderchan_exec_path:
+            renderchan_command[:] = [renderchan_exec_path]
+        else:
+            renderchan_command[:] = [getattr(bpy.app, "binary_path_python", sys.executable), os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan", "bin", "renderchan")]
+        
+        import renderchan
+        importlib.reload(renderchan)
+    renderchan_ready = True
+
+def find_project(path):
+    """The directory of the project.conf above path, found without loading RenderChan"""
+    directory = os.path.dirname(os.path.abspath(path))
+    while True:
+        if os.path.exists(os.path.join(directory, "project.conf")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
 
 bl_info = {
     "name": "Import with RenderChan",
@@ -39,30 +83,315 @@ bl_info = {
     "category": "Import-Export"
 }
 
-def reinit_renderchan():
-    output = io.StringIO()
-    with redirect_stdout(output):
-        rcl.main = RenderChan()
-    rcl.main.datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan", "templates")
-    if bpy.context.scene.renderchan.profile != "default":
-        rcl.main.setProfile(bpy.context.scene.renderchan.profile)
-    if bpy.context.scene.renderchan.render_farm != "none":
-        rcl.main.renderfarm_engine = bpy.context.scene.renderchan.render_farm
-    if bpy.context.scene.renderchan.render_farm == "afanasy" and bpy.context.scene.renderchan.cgru_location:
-        rcl.main.cgru_location = bpy.context.scene.renderchan.cgru_location
-    
-
-def refresh_everything():
-    bpy.ops.sequencer.refresh_all()
+class ResolvedFile():
+    def __init__(self, path, file, stamp, conf_path, conf_stamp):
+        self.path = path
+        self.file = file
+        self.project = file.project
+        self.module = file.module
+        self.render_path = file.getRenderPath() if file.project != None and file.module else None
+        # Frames of an image sequence live inside the render path
+        self.is_renderchan = self.render_path is not None and (self.render_path == path or os.path.dirname(path) == self.render_path)
+        self.stamp = stamp
+        self.conf_path = conf_path
+        self.conf_stamp = conf_stamp
+        self._dependencies = None
+    
+    def dependencies(self):
+        if self._dependencies is None:
+            self._dependencies = []
+            if self.project != None and self.module:
+                with profiler.phase("dependencies"), quiet():
+                    self._dependencies = list(self.file.getDependencies())
+        return self._dependencies
+
+class RenderChanFileCache():
+    """
+    Path-keyed cache of RenderChanFile resolutions. Entries are invalidated when
+    the file or its project.conf changes on disk, and the least recently used
+    entries are dropped once the cache is full.
+    """
+    def __init__(self, main, size=4096):
+        self.main = main
+        self.size = size
+        self.entries = OrderedDict()
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stamp(self, path):
+        if path is None:
+            return None
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+    
+    def resolve(self, path):
+        from renderchan.file import RenderChanFile
+        
+        entry = self.entries.get(path)
+        if entry is not None:
+            if entry.stamp == self.stamp(path) and entry.conf_stamp == self.stamp(entry.conf_path):
+                self.entries.move_to_end(path)
+                profiler.count("cache_hits")
+                return entry
+            del self.entries[path]
+            if entry.conf_path and entry.conf_stamp != self.stamp(entry.conf_path):
+                # Make RenderChan re-read the modified project.conf
+                self.forget_project(os.path.dirname(entry.conf_path))
+        
+        profiler.count("file_constructions")
+        with profiler.phase("resolve"), quiet():
+            file = RenderChanFile(path, self.main.modules, self.main.projects)
+            conf_path = os.path.join(file.projectPath, "project.conf") if file.project != None else None
+            entry = ResolvedFile(path, file, self.stamp(path), conf_path, self.stamp(conf_path))
+        self.entries[path] = entry
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return entry
+    
+    def forget_project(self, project_path):
+        projects = getattr(self.main.projects, "list", None)
+        if isinstance(projects, dict):
+            projects.pop(project_path, None)
+        for key in [key for key, entry in self.entries.items() if entry.conf_path and os.path.dirname(entry.conf_path) == project_path]:
+            del self.entries[key]
+
+def resolve_file(path):
+    global rcl
+    return rcl.files.resolve(path)
+
+def manifest_for(project_path):
+    global rcl
+    if project_path not in rcl.manifests:
+        rcl.manifests[project_path] = index.RenderManifest(project_path)
+    return rcl.manifests[project_path]
+
+def store_for(project_path):
+    global rcl
+    if project_path not in rcl.stores:
+        rcl.stores[project_path] = index.OutputStore(project_path)
+    return rcl.stores[project_path]
+
+def is_renderchan_path(path):
+    global rcl
+    # Anything the plug-in rendered itself can be answered without RenderChan
+    for manifest in rcl.manifests.values():
+        if manifest.source(path):
+            return True
+    return resolve_file(path).is_renderchan
+
+class RenderChanSession():
+    """
+    Keeps one RenderChan instance alive for the whole Blender session. Loaded
+    modules and parsed projects are reused, while everything RenderChan
+    accumulates during a dependency parse is reset before the next one.
+    benchmarks/check_session.py checks that nothing else is carried over.
+    """
+    persistent = ("modules", "projects", "datadir")
+    
+    def __init__(self):
+        setup_renderchan()
+        from renderchan.core import RenderChan
+        
+        with profiler.phase("renderchan_init"), quiet():
+            self.main = RenderChan()
+        self.main.datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RenderChan", "templates")
+        self.baseline = {}
+        for name, value in vars(self.main).items():
+            if name not in self.persistent:
+                self.baseline[name] = self.copy(value)
+        self.profile = "default"
+    
+    def copy(self, value):
+        try:
+            return copy.deepcopy(value)
+        except Exception:
+            return copy.copy(value)
+    
+    def reset(self):
+        for name in list(vars(self.main)):
+            if name not in self.persistent and name not in self.baseline:
+                delattr(self.main, name)
+        for name, value in self.baseline.items():
+            setattr(self.main, name, self.copy(value))
+    
+    def configure(self, options):
+        """Apply render options, returns True if the parsed projects had to be dropped"""
+        reloaded = False
+        if options["profile"] != self.profile:
+            if options["profile"] == "default":
+                # RenderChan has no way to unset a profile, so start over with fresh projects
+                with quiet():
+                    self.main.projects = type(self.main.projects)()
+                reloaded = True
+            else:
+                self.main.setProfile(options["profile"])
+            self.profile = options["profile"]
+        if options["render_farm"] != "none":
+            self.main.renderfarm_engine = options["render_farm"]
+        if options["render_farm"] == "afanasy" and options["cgru_location"]:
+            self.main.cgru_location = options["cgru_location"]
+        return reloaded
+    
+    def parse_direct_dependency(self, file, options):
+        self.reset()
+        self.configure(options)
+        with profiler.phase("parse_dependencies"), quiet():
+            return self.main.parseDirectDependency(file, False, True)
+
+def image_output(img):
+    if img.source not in ("FILE", "SEQUENCE", "MOVIE") or not img.filepath or img.packed_file:
+        return None
+    path = bpy.path.abspath(img.filepath)
+    return os.path.dirname(path) if img.source == "SEQUENCE" else path
+
+def sequence_output(sequence):
+    if sequence.type == "IMAGE":
+        return bpy.path.abspath(sequence.directory)
+    elif sequence.type == "MOVIE" or sequence.type == "SOUND":
+        return bpy.path.abspath(sequence.filepath)
+    return None
+
+def sequence_sample(sequence):
+    # A path RenderChan can tell the owning file from
+    if sequence.type == "IMAGE":
+        return os.path.join(bpy.path.abspath(sequence.directory), sequence.elements[0].filename) if len(sequence.elements) else None
+    return sequence_output(sequence)
+
+def output_stamps():
+    """Stamps of every render output used by images, movie clips and strips"""
+    with profiler.phase("output_stamps"):
+        return dict([(path, output_stamp(path)) for path in render_outputs()])
+
+def render_outputs():
+    outputs = set()
     for img in bpy.data.images:
-        img.reload()
+        if image_output(img) and is_renderchan_path(bpy.path.abspath(img.filepath)):
+            outputs.add(image_output(img))
+    for clip in bpy.data.movieclips:
+        if is_renderchan_path(bpy.path.abspath(clip.filepath)):
+            outputs.add(bpy.path.abspath(clip.filepath))
+    for scene in bpy.data.scenes:
+        if scene.sequence_editor:
+            for sequence in scene.sequence_editor.sequences_all:
+                sample = sequence_sample(sequence)
+                if sample and is_renderchan_path(sample):
+                    outputs.add(sequence_output(sequence))
+    return outputs
+
+def refresh_everything(stamps=None):
+    with profiler.phase("refresh"):
+        refresh_outputs(stamps)
+
+def refresh_outputs(stamps=None):
+    """
+    Reload what was rerendered since stamps were taken with output_stamps(), or
+    everything if no stamps are given.
+    """
+    if stamps is None:
+        changed = None
+    else:
+        changed = set([path for path, stamp in stamps.items() if output_stamp(path) != stamp])
+        if not changed:
+            return
+    
+    if changed is None or any(sequence_output(sequence) in changed for scene in bpy.data.scenes if scene.sequence_editor \
+            for sequence in scene.sequence_editor.sequences_all):
+        bpy.ops.sequencer.refresh_all()
+    reloaded = set()
+    for img in bpy.data.images:
+        if changed is None or image_output(img) in changed:
+            img.reload()
+            reloaded.add(img.name)
+    for clip in bpy.data.movieclips:
+        if changed is not None and bpy.path.abspath(clip.filepath) in changed:
+            # Reassigning the path makes Blender reopen the clip
+            clip.filepath = clip.filepath
     # Workaround for GUI not updating
     for w in bpy.context.window_manager.windows:
         for a in w.screen.areas:
             for s in a.spaces:
-                if s.type == "IMAGE_EDITOR":
+                if s.type == "IMAGE_EDITOR" and s.image and s.image.name in reloaded:
                     s.image = s.image
 
+frame_pattern = re.compile(r"^(.*?)(\d+)(\.[^.]+)$")
+
+class FrameSequence():
+    def __init__(self, directory, prefix, extension, frames, padding=0):
+        self.directory = directory
+        self.prefix = prefix
+        self.extension = extension
+        # Sorted (frame number, filename) pairs
+        self.frames = frames
+        # Width frame numbers are zero padded to, 0 if they aren't
+        self.padding = padding
+        present = set([number for number, name in frames])
+        self.gaps = [number for number in range(frames[0][0], frames[-1][0] + 1) if number not in present]
+    
+    def filenames(self):
+        """One filename per frame, gaps hold the previous frame"""
+        names = []
+        previous = None
+        for number, name in self.frames:
+            if previous is not None:
+                names += [names[-1]] * (number - previous - 1)
+            names.append(name)
+            previous = number
+        return names
+
+def frame_padding(numbers):
+    """The width most of the zero padded frame numbers have, 0 if none are padded"""
+    widths = [len(number) for number in numbers if len(number) > 1 and number.startswith("0")]
+    return max(set(widths), key=widths.count) if widths else 0
+
+def scan_frames(directory, extension=None):
+    """
+    Find the image sequence in directory with a single listing, instead of
+    assuming RenderChan's file.%05d naming and frame range. Frames named with
+    another padding than the sequence's, left over from an earlier render,
+    are left out rather than shown twice.
+    """
+    groups = {}
+    for name in os.listdir(directory):
+        match = frame_pattern.match(name)
+        if match is None or (extension and match.group(3).lower() != "." + extension.lower()):
+            continue
+        groups.setdefault((match.group(1), match.group(3)), []).append((int(match.group(2)), name))
+    if not groups:
+        return None
+    (prefix, found_extension), frames = max(groups.items(), key=lambda group: len(group[1]))
+    number = lambda name: name[len(prefix):len(name) - len(found_extension)]
+    padding = frame_padding([number(name) for frame, name in frames])
+    if padding:
+        # Numbers too big for the padding are longer, but never start with a zero
+        frames = [(frame, name) for frame, name in frames if len(number(name)) == padding or \
+            (len(number(name)) > padding and not number(name).startswith("0"))]
+    frames.sort()
+    return FrameSequence(directory, prefix, found_extension, frames, padding)
+
+def add_image_sequence(scene, sequence, frame_start, channel, relative_path=True, replace_sel=True):
+    """
+    Add a strip for a FrameSequence through the data API, with the frames'
+    actual names and the previous frame held over gaps.
+    """
+    editor = scene.sequence_editor or scene.sequence_editor_create()
+    names = sequence.filenames()
+    strip = editor.sequences.new_image(os.path.basename(os.path.normpath(sequence.directory)), \
+        os.path.join(sequence.directory, names[0]), channel, frame_start)
+    append = strip.elements.append
+    for name in names[1:]:
+        append(name)
+    if relative_path:
+        strip.directory = os.path.join(bpy.path.relpath(sequence.directory), "")
+    if replace_sel:
+        for other in editor.sequences_all:
+            other.select = False
+        strip.select = True
+        editor.active_strip = strip
+    return strip
+
 def draw_render_options(layout, scene):
     layout.prop(scene.renderchan, "profile", icon="UI")
     layout.prop(scene.renderchan, "stereo", icon="VIEW3D")
@@ -85,29 +414,352 @@ def add_render_button(self, context):
         draw_render_options(self.layout, context.scene)
         self.layout.operator(RenderChanRender.bl_idname, icon="RENDER_ANIMATION")
 
-def render_file(file, scene, dependenciesOnly):
+def draw_job_status(layout):
     global rcl
-    if scene.renderchan.profile != "default":
-        rcl.main.setProfile(scene.renderchan.profile)
-    if scene.renderchan.render_farm != "none":
-        rcl.main.renderfarm_engine = scene.renderchan.render_farm
-    else:
-        rcl.main.renderfarm_engine = ""
-    if scene.renderchan.render_farm == "afanasy" and scene.renderchan.cgru_location:
-        rcl.main.cgru_location = scene.renderchan.cgru_location
-    if scene.renderchan.stereo == "none":
-        stereo = None
-    else:
-        stereo = scene.renderchan.stereo
+    if not rcl.jobs.active:
+        return
+    for job in rcl.jobs.running[:3]:
+        if job.output.frame:
+            layout.label("Rendering %s: frame %d of %d" % ((os.path.basename(job.path),) + job.output.frame), icon="RENDER_ANIMATION")
+        elif job.progress is not None:
+            layout.label("Rendering %s: %d%%" % (os.path.basename(job.path), int(job.progress * 100)), icon="RENDER_ANIMATION")
+        else:
+            layout.label("Rendering %s" % os.path.basename(job.path), icon="RENDER_ANIMATION")
+        if job.last_line:
+            layout.label(job.last_line)
+    layout.label("%d%% of RenderChan jobs done" % int(rcl.jobs.progress() * 100))
+    layout.operator(RCCancelJobs.bl_idname, icon="CANCEL")
+
+def job_options(scene):
+    return {
+        "profile": scene.renderchan.profile,
+        "stereo": scene.renderchan.stereo,
+        "render_farm": scene.renderchan.render_farm,
+        "cgru_location": scene.renderchan.cgru_location,
+        "log_output": scene.renderchan.log_output
+    }
+
+def render_current(path, options):
+    """Whether the manifest says the render of path is up to date"""
+    resolved = resolve_file(path)
+    if resolved.project == None or not resolved.module:
+        return False
+    return manifest_for(resolved.file.projectPath).current(path, options["profile"], options["stereo"])
+
+def show_output(name, job):
+    """Put the last lines a job printed in a text block, so they survive a failure"""
+    text = bpy.data.texts.get(name) or bpy.data.texts.new(name)
+    text.clear()
+    text.write("%s\n\n%s\n" % (job.path, job.output.text()))
+    if job.log_path:
+        text.write("\nFull log: %s\n" % job.log_path)
+
+def render_job(path, options, dependenciesOnly=False, on_finish=None, depends=None, after=None):
+    setup_renderchan()
+    job = jobs.RenderJob(path, options, dependenciesOnly, on_finish, depends, after)
+    if options.get("log_output"):
+        # Files of the same name in different directories get logs of their own
+        name = "%s.%s.log" % (os.path.basename(path), hashlib.sha1(path.encode("utf-8")).hexdigest()[:8])
+        job.log_path = os.path.join(tempfile.gettempdir(), "renderchan-blender", name)
+    # With a render farm nothing has been rendered yet when RenderChan returns
+    if not dependenciesOnly and options["render_farm"] == "none":
+        job.reuse = output_reuser(path, options)
+        job.on_success = render_recorder(path, options)
+    return job
+
+def output_reuser(path, options):
+    """
+    A function putting a cached output of an earlier render of the same
+    contents with the same options back into the render path of path, for
+    RenderJob.reuse. Hashing the sources to find it can take a while, so this
+    runs on the job's thread. A preview job takes the full quality output
+    instead if there is one. None outside of projects.
+    """
+    resolved = resolve_file(path)
+    if resolved.project == None or not resolved.module:
+        return None
+    manifest = manifest_for(resolved.file.projectPath)
+    store = store_for(resolved.file.projectPath)
+    render_path = resolved.file.getRenderPath()
+    dependencies = render_dependencies(path)
+    profiles = [options["profile"]]
+    if options.get("final_profile"):
+        profiles.insert(0, options["final_profile"])
+    def reuse(job):
+        for profile in profiles:
+            if manifest.current(path, profile, options["stereo"]):
+                return True
+            with profiler.phase("restore_output"):
+                if store.restore(path, render_path, profile, options["stereo"], dependencies):
+                    profiler.count("outputs_restored")
+                    manifest.record(path, render_path, profile, options["stereo"], dependencies)
+                    return True
+        return False
+    return reuse
+
+def render_recorder(path, options):
+    """
+    A function recording a finished render of path in its project's manifest
+    and caching its output, None outside of projects
+    """
+    resolved = resolve_file(path)
+    if resolved.project == None or not resolved.module:
+        return None
+    manifest = manifest_for(resolved.file.projectPath)
+    store = store_for(resolved.file.projectPath)
+    render_path = resolved.file.getRenderPath()
+    dependencies = render_dependencies(path)
+    def record(job):
+        manifest.record(path, render_path, options["profile"], options["stereo"], dependencies)
+        store.save(path, render_path, options["profile"], options["stereo"], dependencies)
+    return record
+
+def render_dependencies(path):
+    """Every file the render of path depends on, directly or not"""
+    return sorted(set(resolve_file(path).dependencies()) | dependency_closure(path, {}))
+
+def render_file(file, scene, dependenciesOnly, on_finish=None, report=None):
+    """
+    Render file in the background and call on_finish(job, context) once it's
+    done, right away if it is up to date. The error on_finish may return is
+    passed to report() then, as there is no job for the monitor to report it.
+    """
+    global rcl
+    if not dependenciesOnly:
+        queued = render_files([file], scene)
+        if not queued:
+            if on_finish:
+                error = on_finish(None, bpy.context)
+                if error and report:
+                    report(error)
+            return None
+        job = queued[0]
+        if on_finish:
+            # Whichever of the preview and the full quality render succeeds first calls it
+            called = []
+            def finish_once(finished, context):
+                if called:
+                    return None
+                called.append(finished)
+                return on_finish(finished, context)
+            for finishing in job.after + [job]:
+                finishing.on_finish = finish_once
+        return job
+    rcl.jobs.workers = scene.renderchan.workers
+    job = rcl.jobs.submit(render_job(file.getPath(), job_options(scene), dependenciesOnly, on_finish))
+    bpy.ops.wm.rc_job_monitor("INVOKE_DEFAULT")
+    return job
+
+def dependency_closure(path, closures):
+    if path in closures:
+        return closures[path]
+    closures[path] = set()
+    closure = set()
+    for dependency in resolve_file(path).dependencies():
+        resolved = resolve_file(dependency)
+        if resolved.project == None or not resolved.module:
+            continue
+        dependency = resolved.file.getPath()
+        closure.add(dependency)
+        closure |= dependency_closure(dependency, closures)
+    closures[path] = closure
+    return closure
+
+def queue_renders(files, options, check_current=True, after=None):
+    """
+    Queue several files at once. Dependencies shared by more than one of the
+    files get their own job which the dependent jobs wait for, so that they are
+    rendered only once while independent files render in parallel. Files that
+    are up to date are skipped unless check_current is False. after maps paths
+    to jobs their render only starts behind, whether those succeed or not. On
+    the Afanasy render farm all of it becomes a single farm job.
+    """
+    global rcl
+    after = after or {}
+    roots = []
+    for file in files:
+        if file.getPath() not in roots and not (check_current and render_current(file.getPath(), options)):
+            roots.append(file.getPath())
+    closures = {}
+    users = {}
+    for path in roots:
+        for dependency in set([path]) | dependency_closure(path, closures):
+            users[dependency] = users.get(dependency, 0) + 1
+    shared = set([path for path, count in users.items() if count > 1])
+    if options["render_farm"] == "afanasy":
+        return [submit_farm(roots, closures, shared, options, [job for path in roots for job in after.get(path, [])])] if roots else []
     
-    output = io.StringIO()
-    with redirect_stdout(output):
-        rcl.main.submit(file, dependenciesOnly, False, stereo)
+    submitted = {}
+    def submit(path):
+        if path not in submitted:
+            depends = [submit(dependency) for dependency in sorted(closures[path] & shared)]
+            submitted[path] = rcl.jobs.submit(render_job(path, options, depends=depends, after=after.get(path)))
+        return submitted[path]
+    for path in roots:
+        submit(path)
+    return [submitted[path] for path in roots]
+
+def submit_farm(roots, closures, shared, options, after=()):
+    """
+    Queue one Afanasy job for roots, laid out like queue_renders() does: each
+    file is a block, and blocks wait for the blocks of their shared
+    dependencies. The farm nodes run RenderChan without a render farm.
+    """
+    global rcl
+    setup_renderchan()
+    local = dict(options, render_farm="none")
+    blocks = []
+    added = set()
+    def add(path):
+        if path in added:
+            return
+        added.add(path)
+        depends = sorted(closures[path] & shared)
+        for dependency in depends:
+            add(dependency)
+        blocks.append({"path": path, "command": renderchan_command + jobs.renderchan_arguments(path, local), "depends": depends})
+    for path in roots:
+        add(path)
+    name = "%s: %d files" % (os.path.basename(bpy.data.filepath) or "RenderChan", len(blocks))
+    job = farm.FarmJob(name, blocks, farm.AfanasyClient(farm.afanasy_address(options.get("cgru_location"))), after=after)
+    for path in job.tasks:
+        recorder = render_recorder(path, local)
+        if recorder:
+            job.on_done[path] = recorder
+    return rcl.jobs.submit(job)
+
+def render_files(files, scene):
+    """
+    Queue files with the scene's options and return the full quality jobs. In
+    preview mode stale files are first rendered with the preview profile, each
+    one at full quality once its preview is over, even if the preview failed.
+    """
+    global rcl
+    rcl.jobs.workers = scene.renderchan.workers
+    options = job_options(scene)
+    # Strips often share a source, check each one once
+    files = list(OrderedDict([(file.getPath(), file) for file in files]).values())
+    stale = [file for file in files if not render_current(file.getPath(), options)]
+    previews = {}
+    if stale and scene.renderchan.preview and scene.renderchan.preview_profile != options["profile"]:
+        for job in queue_renders(stale, dict(options, profile=scene.renderchan.preview_profile, render_farm="none", preview=True, \
+                final_profile=options["profile"])):
+            previews.setdefault(job.path, []).append(job)
+    queued = queue_renders(stale, options, False, previews)
+    if queued:
+        bpy.ops.wm.rc_job_monitor("INVOKE_DEFAULT")
+    return queued
+
+def window_override():
+    """A context for invoking modal operators from code that has no window in its context, like timers"""
+    window = bpy.context.window or (bpy.context.window_manager.windows[0] if bpy.context.window_manager.windows else None)
+    if window is None:
+        return None
+    return {"window": window, "screen": window.screen}
+
+def start_monitor():
+    global rcl
+    override = window_override()
+    if not rcl.monitoring and override is not None:
+        bpy.ops.wm.rc_job_monitor(override, "INVOKE_DEFAULT")
+
+class RCJobMonitor(bpy.types.Operator):
+    """Track background RenderChan jobs and refresh Blender once they are done"""
+    bl_idname = "wm.rc_job_monitor"
+    bl_label = "RenderChan Jobs"
     
-    # Temporary fix
-    reinit_renderchan()
+    def invoke(self, context, event):
+        global rcl
+        if rcl.monitoring:
+            return {"CANCELLED"}
+        rcl.monitoring = True
+        self.rendered = False
+        self.stamps = output_stamps()
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.25, context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {"RUNNING_MODAL"}
     
-    refresh_everything()
+    def modal(self, context, event):
+        global rcl
+        if event.type == "ESC" and event.value == "PRESS":
+            for job in rcl.jobs.cancel():
+                self.report({"WARNING"}, "Cancelled rendering %s" % job.path)
+            return {"RUNNING_MODAL"}
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+        
+        finished = rcl.jobs.poll()
+        # Taken after poll(), so blocks that finished along with their farm job are reloaded as well
+        for job in rcl.jobs.jobs:
+            if isinstance(job, farm.FarmJob):
+                self.reload_paths(job.take_finished())
+        for job in finished:
+            profiler.record({"name": "job %s" % os.path.basename(job.path), "path": job.path, "status": job.status, \
+                "started": job.started, "duration": (job.ended or time.time()) - (job.started or time.time())})
+            if job.status == jobs.DONE:
+                if job.options.get("preview"):
+                    # Show previews while the full quality renders
+                    self.reload_paths([job.path])
+                # Farm submissions render nothing here, and farm jobs reload as their blocks finish
+                self.rendered = self.rendered or (isinstance(job, jobs.RenderJob) and job.options["render_farm"] == "none")
+                if job.on_finish:
+                    error = job.on_finish(job, context)
+                    if error:
+                        self.report({"ERROR"}, error)
+            else:
+                self.report({"ERROR"}, "RenderChan failed to render %s: %s" % (job.path, job.last_line))
+                if isinstance(job, (jobs.RenderJob, farm.FarmJob)) and job.status == jobs.FAILED:
+                    show_output("RenderChan Log", job)
+        context.window_manager.progress_update(int(rcl.jobs.progress() * 100))
+        self.redraw(context)
+        
+        if rcl.jobs.active:
+            return {"PASS_THROUGH"}
+        self.finish(context)
+        if self.rendered:
+            with profiler.run("refresh"):
+                refresh_everything(self.stamps)
+        return {"FINISHED"}
+    
+    def cancel(self, context):
+        self.finish(context)
+    
+    def reload_paths(self, paths):
+        """Reload the outputs of some of the files, while other jobs still run"""
+        outputs = set([os.path.normpath(resolve_file(path).file.getRenderPath()) for path in paths])
+        if not outputs:
+            return
+        stamps = dict([(path, stamp) for path, stamp in self.stamps.items() if os.path.normpath(path) in outputs])
+        if stamps:
+            with profiler.run("refresh"):
+                refresh_everything(stamps)
+            self.stamps.update(dict([(path, output_stamp(path)) for path in stamps]))
+    
+    def finish(self, context):
+        global rcl
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        rcl.jobs.clear()
+        rcl.monitoring = False
+        self.redraw(context)
+    
+    def redraw(self, context):
+        for w in context.window_manager.windows:
+            for a in w.screen.areas:
+                if a.type in ("SEQUENCE_EDITOR", "IMAGE_EDITOR"):
+                    a.tag_redraw()
+
+class RCCancelJobs(bpy.types.Operator):
+    bl_idname = "wm.rc_cancel_jobs"
+    bl_label = "Cancel Rendering"
+    
+    def execute(self, context):
+        global rcl
+        rcl.jobs.cancel()
+        return {"FINISHED"}
 
 class LoadDialog(bpy.types.Operator):
     bl_idname = "object.rc_load_dialog"
@@ -129,22 +781,227 @@ class LoadDialog(bpy.types.Operator):
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self)
  
+    @profiled("LoadDialog")
     def execute(self, context):
         if self.should_update:
             global rcl
             render_file(rcl.blend, context.scene, True)
         return {'FINISHED'}
 
+def sequence_files(sequence):
+    """The RenderChan files a strip was rendered from"""
+    sequence_list = []
+    if sequence.type in ("IMAGE", "MOVIE", "SOUND"):
+        # Resolved once per strip rather than once per frame
+        sample = sequence_sample(sequence)
+        resolved = resolve_file(sample) if sample else None
+        if resolved is not None and resolved.is_renderchan:
+            sequence_list.append(resolved.file)
+    elif sequence.type == "META":
+        for subsequence in sequence.sequences:
+            for file in sequence_files(subsequence):
+                is_unique = True
+                for compare_file in sequence_list:
+                    if compare_file.getPath() == file.getPath():
+                        is_unique = False
+                        break
+                if is_unique:
+                    sequence_list.append(file)
+    return sequence_list
+
+def scene_files(scenes):
+    """
+    The RenderChan files behind the images and movie clips and the strips of
+    scenes, by source path. Image strips are resolved through one frame each.
+    """
+    files = {}
+    def add(path):
+        if not path:
+            return
+        for candidate in (path, os.path.dirname(path)):
+            resolved = resolve_file(candidate)
+            if resolved.is_renderchan:
+                files[resolved.file.getPath()] = resolved.file
+                return
+    for img in bpy.data.images:
+        if image_output(img):
+            add(bpy.path.abspath(img.filepath))
+    for clip in bpy.data.movieclips:
+        add(bpy.path.abspath(clip.filepath))
+    for scene in scenes:
+        if scene.sequence_editor:
+            for sequence in scene.sequence_editor.sequences_all:
+                if sequence.type != "META":
+                    for file in sequence_files(sequence):
+                        files[file.getPath()] = file
+    return files
+
+# Seconds between checks of the watched sources, and between looking for new strips and dependencies
+watch_interval = 0.5
+watch_rescan = 10.0
+
+def watched_sources(paths, known):
+    """
+    Maps every source the renders of paths depend on to the paths that have
+    to be rerendered when it changes. Working out dependencies can take a
+    while, for .blend files RenderChan starts Blender, so this runs on a
+    background thread with a RenderChan session of its own. known keeps the
+    dependencies of each file along with its stamp between runs.
+    """
+    from renderchan.file import RenderChanFile
+    global rcl
+    
+    if rcl.watch_session is None:
+        rcl.watch_session = RenderChanSession()
+    session = rcl.watch_session
+    session.reset()
+    def dependencies(path):
+        """(path, has a module) pairs of the direct dependencies of path"""
+        stamp = index.file_stamp(path)
+        if path not in known or known[path][0] != stamp:
+            found = []
+            with quiet():
+                file = RenderChanFile(path, session.main.modules, session.main.projects)
+                if file.project != None and file.module:
+                    for dependency in file.getDependencies():
+                        dependency_file = RenderChanFile(dependency, session.main.modules, session.main.projects)
+                        if dependency_file.project != None and dependency_file.module:
+                            found.append((dependency_file.getPath(), True))
+                        else:
+                            # Files RenderChan has no module for, like textures, are watched but not followed
+                            found.append((dependency, False))
+            known[path] = (stamp, found)
+        return known[path][1]
+    
+    users = {}
+    for path in paths:
+        pending = [path]
+        seen = set(pending)
+        while pending:
+            source = pending.pop()
+            users.setdefault(source, set()).add(path)
+            for dependency, followed in dependencies(source):
+                if dependency in seen:
+                    continue
+                seen.add(dependency)
+                if followed:
+                    pending.append(dependency)
+                else:
+                    users.setdefault(dependency, set()).add(path)
+    return users
+
+def watch_tick():
+    """
+    One step of watch mode: pick up new sources now and then, and queue the
+    files affected by sources that were saved and then left alone. Returns
+    the seconds until the next step, or None once watching stopped.
+    """
+    global rcl
+    scene = bpy.context.scene
+    if rcl.watcher is None or not rcl.is_project or scene is None or not scene.renderchan.watch:
+        stop_watching()
+        return None
+    with profiler.phase("watch"):
+        if rcl.watch_scan is not None and rcl.watch_scan.update():
+            if rcl.watch_scan.status == jobs.DONE:
+                rcl.watched = rcl.watch_scan.result
+                rcl.watcher.watch(rcl.watched)
+            rcl.watch_scan = None
+        if rcl.watch_scan is None and time.time() - rcl.watched_at >= watch_rescan:
+            rcl.watched_at = time.time()
+            # Finding the scene's files is quick and needs bpy, their dependencies are worked out in the background
+            paths = sorted(scene_files([scene]))
+            known = rcl.watch_known
+            rcl.watch_scan = jobs.ThreadJob(bpy.data.filepath, lambda job: watched_sources(paths, known))
+            rcl.watch_scan.start(None)
+        # Leave changes made during a render until it is done, or they would be lost to the running job
+        changed = rcl.watcher.poll(hold=bool(rcl.jobs.active))
+        if not changed:
+            return watch_interval
+        affected = set()
+        for path in changed:
+            affected |= rcl.watched.get(path, set())
+        files = [resolve_file(path).file for path in sorted(affected)]
+        rcl.jobs.workers = scene.renderchan.workers
+        if files and queue_renders(files, job_options(scene)):
+            start_monitor()
+        # Saving may have added dependencies
+        rcl.watched_at = 0
+    return watch_interval
+
+def start_watching():
+    global rcl
+    if rcl.watcher is not None or not rcl.is_project:
+        return
+    rcl.watcher = watch.Watcher()
+    rcl.watched = {}
+    rcl.watched_at = 0
+    if hasattr(bpy.app, "timers"):
+        bpy.app.timers.register(watch_tick, first_interval=watch_interval, persistent=True)
+    elif window_override() is not None:
+        # Blender before 2.80 has no timers, a modal operator does the ticking
+        bpy.ops.wm.rc_watch(window_override(), "INVOKE_DEFAULT")
+
+def stop_watching():
+    global rcl
+    if rcl.watcher is None:
+        return
+    if hasattr(bpy.app, "timers") and bpy.app.timers.is_registered(watch_tick):
+        bpy.app.timers.unregister(watch_tick)
+    rcl.watcher.close()
+    rcl.watcher = None
+    rcl.watched = {}
+    if rcl.watch_scan is not None:
+        # Left to finish on its own, with the session and dependencies it was given
+        rcl.watch_scan.cancel()
+        rcl.watch_scan = None
+        rcl.watch_session = None
+        rcl.watch_known = {}
+
+def update_watch(options, context):
+    if options.watch:
+        start_watching()
+    else:
+        stop_watching()
+
+class RCWatch(bpy.types.Operator):
+    """Run watch mode's ticks where bpy.app.timers is not available"""
+    bl_idname = "wm.rc_watch"
+    bl_label = "Watch RenderChan Sources"
+    
+    def invoke(self, context, event):
+        global rcl
+        self.watcher = rcl.watcher
+        self.ticked = 0
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(watch_interval, context.window)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+    
+    def modal(self, context, event):
+        global rcl
+        if rcl.watcher is not self.watcher:
+            # Stopped, or replaced after loading another file
+            self.cancel(context)
+            return {"FINISHED"}
+        # Every event timer sends TIMER events, the job monitor's included
+        if event.type == "TIMER" and time.time() - self.ticked >= watch_interval:
+            self.ticked = time.time()
+            if watch_tick() is None:
+                self.cancel(context)
+                return {"FINISHED"}
+        return {"PASS_THROUGH"}
+    
+    def cancel(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+
 class RCRefreshImage(bpy.types.Operator):
     bl_idname = "image.rc_refresh"
     bl_label = "Rerender"
     
+    @profiled("RCRefreshImage")
     def execute(self, context):
-        from renderchan.file import RenderChanFile
-        global rcl
-        output = io.StringIO()
-        with redirect_stdout(output):
-            file = RenderChanFile(bpy.path.abspath(context.edit_image.filepath), rcl.main.modules, rcl.main.projects)
+        file = resolve_file(bpy.path.abspath(context.edit_image.filepath)).file
         render_file(file, context.scene, False)
         return {"FINISHED"}
 
@@ -152,58 +1009,47 @@ class RCRefreshSequence(bpy.types.Operator):
     bl_idname = "sequencer.rc_refresh"
     bl_label = "Rerender"
     
+    @profiled("RCRefreshSequence")
     def execute(self, context):
-        def get_renderchan_sequences(sequence):
-            from renderchan.file import RenderChanFile
-            
-            sequence_list = []
-            if sequence.type == "IMAGE":
-                for element in sequence.elements:
-                    path = os.path.join(bpy.path.abspath(sequence.directory), element.filename)
-                    file = RenderChanFile(path, rcl.main.modules, rcl.main.projects)
-                    if file.project != None and file.module and file.getRenderPath() == path:
-                        sequence_list.append(file)
-            elif sequence.type == "MOVIE" or sequence.type == "SOUND":
-                path = bpy.path.abspath(sequence.filepath)
-                file = RenderChanFile(path, rcl.main.modules, rcl.main.projects)
-                if file.project != None and file.module and file.getRenderPath() == path:
-                    sequence_list.append(file)
-            elif sequence.type == "META":
-                for subsequence in sequence.sequences:
-                    for file in get_renderchan_sequence(subsequence):
-                        is_unique = True
-                        for compare_file in sequence_list:
-                            if compare_file.getPath() == file.getPath():
-                                is_unique = False
-                                break
-                        if is_unique:
-                            sequence_list.append(file)
-            return sequence_list
-        
-        from renderchan.file import RenderChanFile
-        global rcl
+        files = []
         for sequence in context.selected_sequences:
-            output = io.StringIO()
-            with redirect_stdout(output):
-                files = get_renderchan_sequences(sequence)
-            for file in files:
-                render_file(file, context.scene, False)
+            files += sequence_files(sequence)
+        if files:
+            render_files(files, context.scene)
         return {"FINISHED"}
 
+default_profile_items = [("default", "Default", "The default profile")]
+
 def profile_items(scene, context):
-    from renderchan.utils import ini_wrapper
-    import configparser
     global rcl
     
-    rcl.items = [("default", "Default", "The default profile")]
-    if not rcl.blend or not os.path.exists(os.path.join(rcl.blend.projectPath, "project.conf")):
-        return rcl.items
+    if not rcl.blend:
+        return default_profile_items
+    conf_path = os.path.join(rcl.blend.projectPath, "project.conf")
+    try:
+        mtime = os.path.getmtime(conf_path)
+    except OSError:
+        return default_profile_items
+    cached = rcl.items.get(conf_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    # Only now RenderChan is needed, and only it puts itself on sys.path
+    setup_renderchan()
+    from renderchan.utils import ini_wrapper
+    import configparser
+    items = list(default_profile_items)
+    profiler.count("profile_parses")
     config = configparser.ConfigParser()
-    config.read_file(ini_wrapper(os.path.join(rcl.blend.projectPath, "project.conf")))
+    config.read_file(ini_wrapper(conf_path))
     for section in config.sections():
         if section != "default":
-            rcl.items.append((section, section, ""))
-    return rcl.items
+            items.append((section, section, ""))
+    if cached:
+        # Blender may still hold on to the strings of the old list, so keep it alive
+        rcl.retired_items.append(cached[1])
+    rcl.items[conf_path] = (mtime, items)
+    return items
 
 class RenderOptions(bpy.types.PropertyGroup):
     profile = EnumProperty(items=profile_items, name="Profile", description="What profile RenderChan should use. Leave blank to use the project's default.")
@@ -214,6 +1060,16 @@ class RenderOptions(bpy.types.PropertyGroup):
         name="Render farm", description="Determines what render farm, if any, to use.", default="none")
     # Afanasy render farm only
     cgru_location = StringProperty(name="Cgru Location", description="Cgru directory for Afanasy renderfarm.", default="/opt/cgru", subtype="DIR_PATH")
+    log_output = BoolProperty(name="Log Output", description="Also write RenderChan's output to rotating log files in the temporary directory.", default=False)
+    profiling = BoolProperty(name="Profile", description="Time the RenderChan plug-in and log each operator run.", default=False, \
+        update=lambda self, context: setattr(profiler, "enabled", self.profiling))
+    preview = BoolProperty(name="Preview First", description="Render stale files with the preview profile first, then at full quality in the background.", default=False)
+    preview_profile = EnumProperty(items=profile_items, name="Preview Profile", description="The low resolution profile to render previews with.")
+    cache_size = IntProperty(name="Cache Size (GB)", description="How much disk space earlier renders may take up in each project's render/blender-plugin/outputs.", \
+        default=20, min=0, update=lambda self, context: setattr(index.OutputStore, "limit", self.cache_size << 30))
+    workers = IntProperty(name="Parallel Jobs", description="How many files RenderChan may render at the same time.", default=os.cpu_count() or 1, min=1, max=64)
+    watch = BoolProperty(name="Watch Sources", description="Rerender the images and strips of this scene whenever one of their sources is saved.", \
+        default=False, update=update_watch)
     
     #def __init__(self):
         
@@ -231,16 +1087,12 @@ class ImageEditorPanel(bpy.types.Panel):
         if not rcl.is_project or context.edit_image is None:
             return False
         
-        from renderchan.file import RenderChanFile
-        path = bpy.path.abspath(context.edit_image.filepath)
-        output = io.StringIO()
-        with redirect_stdout(output):
-            file = RenderChanFile(path, rcl.main.modules, rcl.main.projects)
-        return file.project != None and file.module and file.getRenderPath() == path
+        return is_renderchan_path(bpy.path.abspath(context.edit_image.filepath))
     
     def draw(self, context):
         draw_render_options(self.layout, context.scene)
         self.layout.operator("image.rc_refresh", icon="FILE_REFRESH")
+        draw_job_status(self.layout)
 
 class SequenceEditorPanel(bpy.types.Panel):
     bl_label = "RenderChan"
@@ -252,19 +1104,10 @@ class SequenceEditorPanel(bpy.types.Panel):
     @classmethod
     def poll(self, context):
         def is_renderchan_sequence(sequence):
-            from renderchan.file import RenderChanFile
-            
-            if sequence.type == "IMAGE":
-                for element in sequence.elements:
-                    path = os.path.join(bpy.path.abspath(sequence.directory), element.filename)
-                    file = RenderChanFile(path, rcl.main.modules, rcl.main.projects)
-                    if file.project != None and file.module and file.getRenderPath() == path:
-                        return True
-            elif sequence.type == "MOVIE" or sequence.type == "SOUND":
-                path = bpy.path.abspath(sequence.filepath)
-                file = RenderChanFile(path, rcl.main.modules, rcl.main.projects)
-                if file.project != None and file.module and file.getRenderPath() == path:
-                    return True
+            if sequence.type in ("IMAGE", "MOVIE", "SOUND"):
+                # All frames of an image strip share a directory, so the first one tells for the strip
+                sample = sequence_sample(sequence)
+                return sample is not None and is_renderchan_path(sample)
             elif sequence.type == "META":
                 for subsequence in sequence.sequences:
                     if is_renderchan_sequence(subsequence):
@@ -275,16 +1118,54 @@ class SequenceEditorPanel(bpy.types.Panel):
         if not rcl.is_project or context.selected_sequences is None:
             return False
         
-        output = io.StringIO()
-        with redirect_stdout(output):
-            for sequence in context.selected_sequences:
-                if is_renderchan_sequence(sequence):
-                    return True
+        for sequence in context.selected_sequences:
+            if is_renderchan_sequence(sequence):
+                return True
         return False
     
     def draw(self, context):
         draw_render_options(self.layout, context.scene)
+        self.layout.prop(context.scene.renderchan, "preview")
+        if context.scene.renderchan.preview:
+            self.layout.prop(context.scene.renderchan, "preview_profile", icon="UI")
+        self.layout.prop(context.scene.renderchan, "workers")
+        self.layout.prop(context.scene.renderchan, "cache_size")
+        self.layout.prop(context.scene.renderchan, "log_output")
+        self.layout.prop(context.scene.renderchan, "profiling")
+        self.layout.prop(context.scene.renderchan, "watch")
+        global rcl
+        if rcl.watcher is not None:
+            self.layout.label("Watching %d sources (%s)" % (len(rcl.watcher.paths), rcl.watcher.kind), icon="VISIBLE_IPO_ON")
         self.layout.operator("sequencer.rc_refresh", icon="FILE_REFRESH")
+        draw_job_status(self.layout)
+
+class ProfilePanel(bpy.types.Panel):
+    bl_label = "RenderChan Profile"
+    bl_space_type = "SEQUENCE_EDITOR"
+    bl_region_type = "UI"
+    
+    @classmethod
+    def poll(self, context):
+        return profiler.enabled
+    
+    def draw(self, context):
+        self.layout.prop(context.scene.renderchan, "profiling")
+        for line in profiler.summary()[:30]:
+            self.layout.label(line)
+        self.layout.operator(RCProfileReport.bl_idname, icon="TEXT")
+
+class RCProfileReport(bpy.types.Operator):
+    """Write the timings of the last RenderChan runs to a text block"""
+    bl_idname = "wm.rc_profile_report"
+    bl_label = "Write Profile to Text"
+    
+    def execute(self, context):
+        text = bpy.data.texts.get("RenderChan Profile") or bpy.data.texts.new("RenderChan Profile")
+        text.clear()
+        text.write("\n".join(profiler.summary()) + "\n")
+        if profiler.log_path:
+            text.write("\nFull log: %s\n" % profiler.log_path)
+        return {"FINISHED"}
 
 class RenderChanImporter(Operator, ImportHelper):
     bl_idname = "import.renderchan"
@@ -345,13 +1226,10 @@ class RenderChanSequenceAdd(Operator, ImportHelper):
         self.layout.prop(self, "sound")
         self.layout.prop(self, "cache")
     
+    @profiled("RenderChanSequenceAdd")
     def execute(self, context):
-        from renderchan.file import RenderChanFile
-        
         path = bpy.path.abspath(self.properties.filepath)
-        output = io.StringIO()
-        with redirect_stdout(output):
-            file = RenderChanFile(path, rcl.main.modules, rcl.main.projects)
+        file = resolve_file(path).file
         if file.project == None or not file.module:
             # Not a RenderChan file, just add
             if os.path.splitext(path)[1] in bpy.path.extensions_movie:
@@ -366,73 +1244,187 @@ class RenderChanSequenceAdd(Operator, ImportHelper):
             else:
                 self.report({"ERROR"}, "Could not handle this file format");
         else:
-            # It is a RenderChan file, render if necessary and then add.
-            if file.getRenderPath() == path:
-                path = file.getPath()
-            render_file(file, context.scene, False)
-            
-            if os.path.isdir(file.getRenderPath()):
-                file_list = []
-                for i in range(file.getStartFrame(), file.getEndFrame()):
-                    file_list.append({"name": "file.%05d.%s" % (i, file.getFormat())})
-                bpy.ops.sequencer.image_strip_add(directory=file.getRenderPath(), files=file_list, relative_path=self.rel_path, frame_start=self.start, channel=self.channel, replace_sel=self.replace)
-            elif os.path.splitext(file.getRenderPath())[1] in bpy.path.extensions_movie:
-                bpy.ops.sequencer.movie_strip_add(filepath=file.getRenderPath(), relative_path=self.rel_path, frame_start=self.start, channel=self.channel, replace_sel=self.replace, sound=self.sound)
-            elif os.path.splitext(file.getRenderPath())[1] in bpy.path.extensions_image:
-                bpy.ops.sequencer.image_strip_add(directory=os.path.dirname(file.getRenderPath()), files=[{"name":os.path.basename(file.getRenderPath())}], relative_path=self.rel_path, frame_start=self.start, channel=self.channel, replace_sel=self.replace)
-            else:
-                self.report({"ERROR"}, "Could not handle this file format");
+            # It is a RenderChan file, render if necessary and then add once the render is done.
+            settings = {"relative_path": self.rel_path, "frame_start": self.start, "channel": self.channel, "replace_sel": self.replace}
+            sound = self.sound
+            def add_render(job, context):
+                render_path = file.getRenderPath()
+                if os.path.isdir(render_path):
+                    frames = scan_frames(render_path, file.getFormat())
+                    if frames is None:
+                        return "No rendered frames found in %s" % render_path
+                    add_image_sequence(context.scene, frames, settings["frame_start"], settings["channel"], settings["relative_path"], settings["replace_sel"])
+                    if frames.gaps:
+                        return "Frames missing from %s, holding the previous frame for %d frames" % (render_path, len(frames.gaps))
+                elif os.path.splitext(render_path)[1] in bpy.path.extensions_movie:
+                    bpy.ops.sequencer.movie_strip_add(filepath=render_path, sound=sound, **settings)
+                elif os.path.splitext(render_path)[1] in bpy.path.extensions_image:
+                    bpy.ops.sequencer.image_strip_add(directory=os.path.dirname(render_path), files=[{"name":os.path.basename(render_path)}], **settings)
+                else:
+                    return "Could not handle this file format"
+            render_file(file, context.scene, False, add_render, lambda error: self.report({"ERROR"}, error))
         return {"FINISHED"}
 
 class RenderChanRender(Operator):
     bl_idname = "render.renderchan"
     bl_label = "Render with RenderChan"
     
+    @profiled("RenderChanRender")
     def execute(self, context):
-        from renderchan.file import RenderChanFile
-        
-        output = io.StringIO()
-        with redirect_stdout(output):
-            file = RenderChanFile(bpy.path.abspath(context.blend_data.filepath), rcl.main.modules, rcl.main.projects)
+        file = resolve_file(bpy.path.abspath(context.blend_data.filepath)).file
         render_file(file, context.scene, False)
         return {"FINISHED"}
 
-@persistent
-def load_handler(something):
+def render_stale(path, render_path):
+    # Goes by the newest frame of a sequence, rendering over frames leaves the directory's mtime alone
+    stamp = output_stamp(render_path)
+    try:
+        return stamp is None or os.path.getmtime(path) > stamp[0]
+    except OSError:
+        return True
+
+def scan_dependencies(path, options):
+    """
+    Check whether any direct dependency of path needs to be rendered. Only the
+    dependencies whose source or render, or any of whose own dependencies,
+    changed since the last scan of this file are checked with RenderChan again. This runs on a background thread,
+    so it has a RenderChan session of its own.
+    """
     from renderchan.file import RenderChanFile
+    global rcl
+    
+    if rcl.scan_session is None:
+        rcl.scan_session = RenderChanSession()
+    session = rcl.scan_session
+    session.reset()
+    session.configure(options)
+    with quiet():
+        file = RenderChanFile(path, session.main.modules, session.main.projects)
+    dependency_index = index.DependencyIndex(file.projectPath)
+    manifest = rcl.manifests.get(file.projectPath) or index.RenderManifest(file.projectPath)
+    entry = dependency_index.get(path)
+    dependencies = None
+    if not dependency_index.listed(path):
+        # New or saved since the last scan: read the list again, but keep the records of unchanged dependencies
+        with quiet():
+            dependencies = list(file.getDependencies())
+    changed = dependency_index.changed(entry, dependencies)
     
+    loaded = {}
+    def load(source):
+        if source not in loaded:
+            with quiet():
+                loaded[source] = RenderChanFile(source, session.main.modules, session.main.projects)
+        return loaded[source]
+    def sources(source_file, found):
+        """Stamps of everything source_file depends on, directly or not"""
+        with quiet():
+            direct = list(source_file.getDependencies())
+        for source in direct:
+            if source not in found:
+                found[source] = index.file_stamp(source)
+                if load(source).project != None and load(source).module:
+                    sources(load(source), found)
+        return found
+    
+    results = {}
+    for dependency in changed:
+        dependency_file = load(dependency)
+        if dependency_file.project == None or not dependency_file.module:
+            results[dependency] = (None, False, {})
+            continue
+        render_path = dependency_file.getRenderPath()
+        if manifest.current(dependency, options["profile"], options["stereo"]):
+            results[dependency] = (render_path, False, manifest.dependencies(dependency))
+            continue
+        dirty = render_stale(dependency, render_path) or session.parse_direct_dependency(dependency_file, options)[0]
+        # A clean dependency has to be checked again once anything it depends on changes
+        results[dependency] = (render_path, bool(dirty), {} if dirty else sources(dependency_file, {}))
+    if dependencies is not None or changed:
+        dependency_index.update(path, results, dependencies)
+        dependency_index.save()
+    return dependency_index.dirty(path)
+
+@persistent
+@profiled("load_handler")
+def load_handler(something):
+    if bpy.context.scene.renderchan.profiling:
+        profiler.enabled = True
+    index.OutputStore.limit = bpy.context.scene.renderchan.cache_size << 30
     global rcl
-    output = io.StringIO()
-    with redirect_stdout(output):
-        rcl.blend = RenderChanFile(bpy.data.filepath, rcl.main.modules, rcl.main.projects)
+    stop_watching()
+    if not bpy.data.filepath or find_project(bpy.data.filepath) is None:
+        # Not a RenderChan project, don't load RenderChan at all
+        rcl.blend = None
+        rcl.is_project = False
+        return
+    rcl.blend = resolve_file(bpy.data.filepath).file
     rcl.is_project = rcl.blend.project != None
     if not rcl.is_project:
         return
     
-    with redirect_stdout(output):
-        deps = rcl.main.parseDirectDependency(rcl.blend, False, True)
-    # Temporary fix
-    reinit_renderchan()
-    if deps[0]:
-        bpy.ops.object.rc_load_dialog('INVOKE_DEFAULT')
+    manifest_for(rcl.blend.projectPath)
+    path = rcl.blend.getPath()
+    options = job_options(bpy.context.scene)
+    def show_dialog(job, context):
+        if job.result and rcl.blend and rcl.blend.getPath() == path:
+            bpy.ops.object.rc_load_dialog('INVOKE_DEFAULT')
+    rcl.jobs.submit(jobs.ThreadJob(path, lambda job: scan_dependencies(path, options), show_dialog))
+    bpy.ops.wm.rc_job_monitor("INVOKE_DEFAULT")
+    if bpy.context.scene.renderchan.watch:
+        start_watching()
 
 class RenderChanLibrary():
+    """
+    Everything the add-on keeps between operator calls. RenderChan itself is
+    only loaded the first time session, main or files is used.
+    """
     def __init__(self):
-        from renderchan.file import RenderChanFile
-        
-        output = io.StringIO()
-        with redirect_stdout(output):
-            self.main = RenderChan()
-        self.main.datadir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+        self._session = None
+        self._files = None
+        self.scan_session = None
+        self.jobs = jobs.JobQueue(renderchan_command)
+        self.monitoring = False
         self.is_project = False
-        self.items = []
+        # Profile enum items per project.conf, with the mtime they were read at
+        self.items = {}
+        self.retired_items = []
+        # RenderManifest and OutputStore per project path
+        self.manifests = {}
+        self.stores = {}
         self.blend = None
+        # Watch mode: the Watcher, the files each watched source affects and when that was worked out
+        self.watcher = None
+        self.watched = {}
+        self.watched_at = 0
+        # The background rescan of the watched sources, its session and the dependencies it found per file
+        self.watch_scan = None
+        self.watch_session = None
+        self.watch_known = {}
+    
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = RenderChanSession()
+        return self._session
+    
+    @property
+    def main(self):
+        return self.session.main
+    
+    @property
+    def files(self):
+        if self._files is None:
+            self._files = RenderChanFileCache(self.main)
+        return self._files
 
 def register():
     # DO NOT REMOVE THIS LINE!! Without it, the plugin becomes a fork bomb.
     if bpy.app.background:
         return
     
+    if not profiler.log_path:
+        profiler.log_path = os.path.join(tempfile.gettempdir(), "renderchan-blender-profile.jsonl")
     global rcl
     rcl = RenderChanLibrary()
     
@@ -446,6 +1438,11 @@ def register():
     bpy.utils.register_class(ImageEditorPanel)
     bpy.utils.register_class(SequenceEditorPanel)
     bpy.utils.register_class(RenderChanRender)
+    bpy.utils.register_class(RCJobMonitor)
+    bpy.utils.register_class(RCCancelJobs)
+    bpy.utils.register_class(RCWatch)
+    bpy.utils.register_class(ProfilePanel)
+    bpy.utils.register_class(RCProfileReport)
     #bpy.types.INFO_MT_file_import.append(add_import_button)
     bpy.types.RENDER_PT_render.append(add_render_button)
     bpy.types.SEQUENCER_MT_add.append(add_sequence_add_button)
@@ -455,6 +1452,7 @@ def unregister():
     if bpy.app.background:
         return
     
+    stop_watching()
     del bpy.types.Scene.renderchan
     bpy.utils.unregister_class(RenderOptions)
     bpy.utils.unregister_class(RenderChanImporter)
@@ -465,6 +1463,11 @@ def unregister():
     bpy.utils.unregister_class(ImageEditorPanel)
     bpy.utils.unregister_class(SequenceEditorPanel)
     bpy.utils.unregister_class(RenderChanRender)
+    bpy.utils.unregister_class(RCJobMonitor)
+    bpy.utils.unregister_class(RCCancelJobs)
+    bpy.utils.unregister_class(RCWatch)
+    bpy.utils.unregister_class(ProfilePanel)
+    bpy.utils.unregister_class(RCProfileReport)
     #bpy.types.INFO_MT_mesh_add.remove(add_import_button)
     bpy.types.RENDER_PT_render.append(add_render_button)
     bpy.types.SEQUENCER_MT_add.remove(add_sequence_add_button)
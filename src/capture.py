@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+class OutputSink():
+    """
+    File-like target for RenderChan's output. Only the last lines are kept in
+    memory, everything can optionally be mirrored to a size-limited rotating
+    log file, and progress such as "frame 12 of 240" is picked up as lines
+    arrive. Memory use doesn't grow with the amount of output.
+    """
+    progress_patterns = [
+        re.compile(r"\bframe:?\s*(\d+)\s*(?:of|/)\s*(\d+)", re.IGNORECASE),
+        re.compile(r"\b(\d+)\s*/\s*(\d+)\s*frames?\b", re.IGNORECASE),
+        re.compile(r"\b(\d+(?:\.\d+)?)\s*%()")
+    ]
+    # Longest partial line kept while waiting for its end
+    line_limit = 4096
+    
+    def __init__(self, lines=200, log_path=None, log_size=1 << 20, log_count=3):
+        self.lines = deque(maxlen=lines)
+        self.partial = ""
+        self.last_line = ""
+        self.progress = None
+        self.frame = None
+        self.log_path = log_path
+        self.log_size = log_size
+        self.log_count = log_count
+        self.log = None
+    
+    def write(self, data):
+        data = self.partial + data.replace("\r", "\n")
+        lines = data.split("\n")
+        self.partial = lines.pop()
+        if len(self.partial) > self.line_limit:
+            lines.append(self.partial)
+            self.partial = ""
+        for line in lines:
+            self.line(line)
+        return len(data)
+    
+    def line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        self.lines.append(line)
+        self.last_line = line
+        self.parse_progress(line)
+        if self.log_path:
+            self.write_log(line)
+    
+    def parse_progress(self, line):
+        for pattern in self.progress_patterns:
+            match = pattern.search(line)
+            if match is None:
+                continue
+            if match.group(2):
+                current, total = int(match.group(1)), int(match.group(2))
+                if total > 0 and current <= total:
+                    self.frame = (current, total)
+                    self.progress = current / total
+            else:
+                self.progress = min(float(match.group(1)) / 100, 1.0)
+            return
+    
+    def write_log(self, line):
+        try:
+            if self.log is None:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                self.log = open(self.log_path, "a")
+            self.log.write(line + "\n")
+            if self.log.tell() >= self.log_size:
+                self.rotate()
+        except OSError:
+            self.log_path = None
+    
+    def rotate(self):
+        self.log.close()
+        self.log = None
+        for i in range(self.log_count - 1, 0, -1):
+            older = "%s.%d" % (self.log_path, i)
+            if os.path.exists(older):
+                os.replace(older, "%s.%d" % (self.log_path, i + 1))
+        os.replace(self.log_path, self.log_path + ".1")
+    
+    def text(self):
+        return "\n".join(list(self.lines))
+    
+    def flush(self):
+        if self.log is not None:
+            self.log.flush()
+    
+    def close(self):
+        if self.partial:
+            self.line(self.partial)
+            self.partial = ""
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+class ThreadRouter():
+    """
+    Stand-in for sys.stdout that sends each thread's output to that thread's
+    own target. contextlib.redirect_stdout swaps sys.stdout for every thread
+    at once, so it can't be used while RenderChan also runs in the background.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    @property
+    def target(self):
+        return getattr(self.local, "target", None) or self.stream
+
+    def write(self, data):
+        return self.target.write(data)
+
+    def flush(self):
+        self.target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def router():
+    # Compare by name, reloading the add-on creates a new ThreadRouter class
+    if type(sys.stdout).__name__ != "ThreadRouter":
+        sys.stdout = ThreadRouter(sys.stdout)
+    return sys.stdout
+
+def recent():
+    """The current thread's default sink, holding the last lines quiet() captured"""
+    stdout = router()
+    if getattr(stdout.local, "recent", None) is None:
+        stdout.local.recent = OutputSink(lines=100)
+    return stdout.local.recent
+
+@contextmanager
+def quiet(sink=None):
+    """Capture what the current thread prints, by default into the bounded recent() sink"""
+    stdout = router()
+    previous = getattr(stdout.local, "target", None)
+    stdout.local.target = sink if sink is not None else recent()
+    try:
+        yield stdout.local.target
+    finally:
+        stdout.local.target = previous
@@ -0,0 +1,198 @@
+import json
+import os
+import re
+import shlex
+import threading
+import time
+
+from . import jobs
+from .index import read_json
+
+def submitter():
+    """User and host name the farm shows jobs under"""
+    import getpass
+    import socket
+    return {"user_name": getpass.getuser(), "host_name": socket.gethostname()}
+
+def afanasy_address(cgru_location=None):
+    """Host and port of the Afanasy server, from CGRU's config and the AF_SERVERNAME/AF_SERVERPORT variables"""
+    config = {}
+    if cgru_location:
+        config = (read_json(os.path.join(cgru_location, "config_default.json")) or {}).get("cgru_config", {})
+    name = os.environ.get("AF_SERVERNAME", config.get("af_servername", "localhost"))
+    port = int(os.environ.get("AF_SERVERPORT", config.get("af_serverport", 51000)))
+    return (name, port)
+
+class AfanasyClient():
+    """Talks JSON over HTTP to an Afanasy server"""
+    def __init__(self, address, timeout=10):
+        self.address = address
+        self.timeout = timeout
+
+    def request(self, data):
+        # Imported here, urllib takes a noticeable part of the add-on's import time
+        import urllib.request
+        request = urllib.request.Request("http://%s:%d/" % self.address, data=json.dumps(data).encode("utf-8"), \
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = response.read().decode("utf-8")
+        return json.loads(body) if body.strip() else {}
+
+    def submit(self, job):
+        """Send a job, returns its id"""
+        reply = self.request({"job": job})
+        if "id" not in reply:
+            raise ValueError("Afanasy did not accept the job: %s" % reply.get("error", reply))
+        return reply["id"]
+
+    def block_states(self, job_id):
+        """The state of each block by name, None if the job is gone"""
+        found = self.request({"get": {"type": "jobs", "ids": [job_id], "mode": "full"}}).get("jobs") or []
+        if not found:
+            return None
+        return dict([(block["name"], block.get("state", "")) for block in found[0].get("blocks", [])])
+
+    def delete(self, job_id):
+        action = {"type": "jobs", "ids": [job_id], "operation": {"type": "delete"}}
+        action.update(submitter())
+        self.request({"action": action})
+
+def afanasy_job(name, blocks):
+    """
+    An Afanasy job with one single-task block per file. A block only starts
+    once the blocks of the files in its "depends" finished.
+    """
+    data = {"name": name, "blocks": []}
+    data.update(submitter())
+    for block in blocks:
+        entry = {
+            "name": block["path"],
+            "service": "generic",
+            "parser": "generic",
+            "tasks": [{"name": os.path.basename(block["path"]), "command": " ".join([shlex.quote(part) for part in block["command"]])}]
+        }
+        if block["depends"]:
+            entry["depend_mask"] = "^(%s)$" % "|".join([re.escape(path) for path in block["depends"]])
+        data["blocks"].append(entry)
+    return data
+
+def block_status(state):
+    tokens = state.split()
+    if "DON" in tokens or "SKP" in tokens:
+        return jobs.DONE
+    if "ERR" in tokens and "RUN" not in tokens and "RDY" not in tokens:
+        return jobs.FAILED
+    if "RUN" in tokens:
+        return jobs.RUNNING
+    return jobs.PENDING
+
+class FarmJob(jobs.Job):
+    """
+    Renders several files as a single Afanasy job. Submitting and following
+    the job's progress happens on a background thread, the files whose blocks
+    finished are picked up from the main thread with take_finished(), so their
+    outputs can be reloaded without waiting for the whole batch.
+    """
+    # Seconds between status requests
+    poll_interval = 5.0
+
+    def __init__(self, name, blocks, client, on_finish=None, depends=None, after=None):
+        jobs.Job.__init__(self, name, {}, False, on_finish, depends, after)
+        self.blocks = blocks
+        self.client = client
+        self.tasks = dict([(block["path"], jobs.PENDING) for block in blocks])
+        # Called with the job on the background thread when the block of a path finished
+        self.on_done = {}
+        self.log_path = None
+        self.farm_id = None
+        self.outcome = jobs.FAILED
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.finished_paths = []
+
+    @property
+    def progress(self):
+        if self.status == jobs.RUNNING:
+            return len([status for status in self.tasks.values() if status == jobs.DONE]) / max(1, len(self.tasks))
+        return jobs.Job.progress.fget(self)
+
+    def log(self, line):
+        self.output.write(line + "\n")
+        self.last_line = self.output.last_line
+
+    def start(self, command):
+        self.status = jobs.RUNNING
+        self.started = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.farm_id = self.client.submit(afanasy_job(self.path, self.blocks))
+            self.log("Submitted Afanasy job %s with %d blocks" % (self.farm_id, len(self.blocks)))
+            while not self.stopped.is_set():
+                states = self.client.block_states(self.farm_id)
+                if states is None:
+                    self.log("The job was deleted from the farm")
+                    return
+                self.update_tasks(states)
+                statuses = set(self.tasks.values())
+                if statuses == set([jobs.DONE]):
+                    self.outcome = jobs.DONE
+                    return
+                if jobs.FAILED in statuses and jobs.RUNNING not in statuses:
+                    # Blocks waiting for a failed one would wait forever
+                    self.log("Failed on the farm: %s" % ", ".join([os.path.basename(path) for path, status in self.tasks.items() \
+                        if status == jobs.FAILED]))
+                    return
+                self.stopped.wait(self.poll_interval)
+        except (OSError, ValueError) as e:
+            self.log("Afanasy: %s" % e)
+        finally:
+            if self.stopped.is_set() and self.farm_id is not None:
+                self.delete()
+
+    def update_tasks(self, states):
+        for path in self.tasks:
+            status = block_status(states.get(path, ""))
+            if status == self.tasks[path]:
+                continue
+            self.tasks[path] = status
+            if status == jobs.DONE:
+                self.log("Rendered %s" % path)
+                if path in self.on_done:
+                    try:
+                        self.on_done[path](self)
+                    except Exception as e:
+                        self.log(str(e))
+                with self.lock:
+                    self.finished_paths.append(path)
+
+    def take_finished(self):
+        """Paths whose blocks finished since the last call"""
+        with self.lock:
+            paths = self.finished_paths
+            self.finished_paths = []
+        return paths
+
+    def delete(self):
+        try:
+            self.client.delete(self.farm_id)
+        except (OSError, ValueError):
+            pass
+
+    def update(self):
+        if self.status != jobs.RUNNING or self.thread.is_alive():
+            return False
+        self.ended = time.time()
+        self.status = self.outcome
+        return True
+
+    def cancel(self):
+        if self.finished:
+            return False
+        # The background thread deletes the job from the farm on its way out
+        self.stopped.set()
+        self.status = jobs.CANCELLED
+        return True
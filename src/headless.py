@@ -0,0 +1,127 @@
+"""
+Render the stale RenderChan dependencies of a .blend file without the UI,
+for example on a render node:
+
+    blender -b shot.blend --python-expr "import renderchan_io.headless as h; h.main()" -- --workers 8
+
+Every RenderChan file used by an image, movie clip or strip is checked, the
+stale ones are rendered in parallel and a JSON summary is printed as the last
+line of output. The exit status is 0 if everything rendered, 1 if something
+failed and 2 if the file could not be handled at all.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import bpy
+
+# Set for everything started from here, so a nested Blender can't start another batch
+guard_variable = "RENDERCHAN_BLENDER_HEADLESS"
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="renderchan_io.headless", description="Render the RenderChan dependencies of the open .blend file.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="How many files to render at the same time")
+    parser.add_argument("--profile", default="default", help="RenderChan profile to render with")
+    parser.add_argument("--stereo", default="none", choices=["none", "v", "vc", "h", "hc", "l", "r"], help="Stereo-3D mode")
+    parser.add_argument("--renderfarm", default="none", choices=["none", "afanasy"], help="Render farm to submit to")
+    parser.add_argument("--cgru-location", default="/opt/cgru", help="Cgru directory for the Afanasy render farm")
+    parser.add_argument("--log-output", action="store_true", help="Write RenderChan's output to rotating log files")
+    parser.add_argument("--cache-size", type=int, default=20, help="Gigabytes of earlier renders to keep per project")
+    parser.add_argument("--force", action="store_true", help="Render every dependency, even if it looks up to date")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be rendered")
+    parser.add_argument("--summary", help="Also write the JSON summary to this file")
+    return parser.parse_args(argv)
+
+def is_stale(addon, file, options):
+    # Cached outputs are restored by the render jobs, so stale includes what will only be restored
+    if addon.render_current(file.getPath(), options):
+        return False
+    if addon.render_stale(file.getPath(), file.getRenderPath()):
+        return True
+    return bool(addon.rcl.session.parse_direct_dependency(file, options)[0])
+
+def job_summary(job):
+    return {
+        "path": job.path,
+        "status": job.status,
+        "returncode": getattr(job, "returncode", None),
+        "duration": (job.ended or time.time()) - job.started if job.started else 0.0,
+        "last_line": job.last_line
+    }
+
+def run(arguments):
+    addon = sys.modules[__package__]
+    summary = {"blend": bpy.data.filepath, "rendered": [], "failed": [], "up_to_date": [], "jobs": []}
+    if os.environ.get(guard_variable):
+        summary["error"] = "Refusing to start a batch from within another batch"
+        return 2, summary
+    if not bpy.data.filepath:
+        summary["error"] = "No .blend file is open"
+        return 2, summary
+    os.environ[guard_variable] = "1"
+
+    # register() stays out of background mode, set up what the UI would have
+    if getattr(addon, "rcl", None) is None:
+        addon.rcl = addon.RenderChanLibrary()
+    rcl = addon.rcl
+    addon.index.OutputStore.limit = arguments.cache_size << 30
+    rcl.blend = addon.resolve_file(bpy.data.filepath).file
+    rcl.is_project = rcl.blend.project != None
+    if not rcl.is_project:
+        summary["error"] = "%s is not part of a RenderChan project" % bpy.data.filepath
+        return 2, summary
+    addon.manifest_for(rcl.blend.projectPath)
+
+    options = {
+        "profile": arguments.profile,
+        "stereo": arguments.stereo,
+        "render_farm": arguments.renderfarm,
+        "cgru_location": arguments.cgru_location,
+        "log_output": arguments.log_output
+    }
+    summary["options"] = options
+    stale = []
+    for path, file in sorted(addon.scene_files(bpy.data.scenes).items()):
+        if arguments.force or is_stale(addon, file, options):
+            stale.append(file)
+        else:
+            summary["up_to_date"].append(path)
+    if arguments.dry_run:
+        summary["stale"] = [file.getPath() for file in stale]
+        return 0, summary
+
+    start = time.time()
+    rcl.jobs.workers = max(1, arguments.workers)
+    addon.queue_renders(stale, options, not arguments.force)
+    try:
+        while rcl.jobs.active:
+            rcl.jobs.poll()
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        rcl.jobs.cancel()
+    for job in rcl.jobs.jobs:
+        summary["jobs"].append(job_summary(job))
+        # A farm job renders many files, each with a status of its own
+        for path, status in sorted((getattr(job, "tasks", None) or {job.path: job.status}).items()):
+            (summary["rendered"] if status == "DONE" else summary["failed"]).append(path)
+    summary["duration"] = time.time() - start
+    return (1 if summary["failed"] else 0), summary
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    arguments = parse_arguments(argv)
+    code, summary = run(arguments)
+    summary["exit_code"] = code
+    text = json.dumps(summary, sort_keys=True)
+    if arguments.summary:
+        try:
+            with open(arguments.summary, "w") as f:
+                f.write(text + "\n")
+        except OSError as e:
+            print("Could not write the summary: %s" % e, file=sys.stderr)
+    sys.stdout.write(text + "\n")
+    sys.stdout.flush()
+    sys.exit(code)
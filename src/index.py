@@ -0,0 +1,373 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+def plugin_directory(project_path):
+    return os.path.join(project_path, "render", "blender-plugin")
+
+def file_stamp(path):
+    if not path:
+        return None
+    try:
+        return [os.path.getmtime(path), os.path.getsize(path)]
+    except OSError:
+        return None
+
+def output_stamp(path):
+    """
+    Like file_stamp() for render outputs. Overwriting frames does not touch
+    their directory, so a frame sequence gets the mtime of its newest frame and
+    the number of frames instead.
+    """
+    try:
+        if os.path.isdir(path):
+            names = os.listdir(path)
+            return [max([os.path.getmtime(os.path.join(path, name)) for name in names] or [0]), len(names)]
+        return [os.path.getmtime(path), os.path.getsize(path)]
+    except (OSError, TypeError):
+        return None
+
+def write_json(path, data):
+    # Write next to the target and rename over it, so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(temporary, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(temporary, path)
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on path + ".lock", shared with other Blender instances"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as f:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            try:
+                import fcntl
+                fcntl.flock(f, fcntl.LOCK_UN)
+            except ImportError:
+                import msvcrt
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def source_current(source, entry):
+    """Whether source and the dependencies recorded in entry are unchanged since entry was made"""
+    stamp = file_stamp(source)
+    if stamp != entry["stamp"]:
+        # Saved without changes, e.g. a touched file
+        if stamp is None or entry["stamp"] is None or stamp[1] != entry["stamp"][1] or file_hash(source) != entry["hash"]:
+            return False
+    for dependency, dependency_stamp in entry["dependencies"].items():
+        if file_stamp(dependency) != dependency_stamp:
+            return False
+    return True
+
+def output_files(path):
+    """Every file of a render output, which is a single file or a directory of frames"""
+    if os.path.isdir(path):
+        return [os.path.join(directory, name) for directory, directories, names in os.walk(path) for name in names]
+    return [path] if os.path.isfile(path) else []
+
+# ioctl(2) request cloning a file on Linux file systems with copy on write
+FICLONE = 0x40049409
+
+def clone_file(source, target):
+    """Copy source to target, sharing its data blocks where the file system can, like Btrfs and XFS"""
+    try:
+        import fcntl
+        with open(source, "rb") as original, open(target, "wb") as clone:
+            fcntl.ioctl(clone.fileno(), FICLONE, original.fileno())
+        shutil.copystat(source, target)
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(source, target)
+
+def copy_output(source, target):
+    """
+    Copy the render output source to target. The copies are files of their
+    own, so whatever later writes to one in place can't change the other.
+    """
+    for path in output_files(source):
+        copied = target if path == source else os.path.join(target, os.path.relpath(path, source))
+        os.makedirs(os.path.dirname(copied), exist_ok=True)
+        clone_file(path, copied)
+
+def remove_output(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+def output_size(path):
+    size = 0
+    for name in output_files(path):
+        try:
+            size += os.path.getsize(name)
+        except OSError:
+            pass
+    return size
+
+class OutputStore():
+    """
+    A cache of render outputs, addressed by what went into them: the contents
+    of the source and of its dependencies, the profile and the stereo mode.
+    Outputs are copied next to the render path, and an output matching the
+    current state of a source is copied back into the render path instead of
+    rendered again, however long ago it was made. RenderChan and other tools
+    render in place, so the cache never shares files with the render path.
+    The least recently used outputs are evicted once the cache grows beyond
+    limit bytes.
+    """
+    limit = 20 << 30
+
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.root = os.path.join(plugin_directory(project_path), "outputs")
+        self.path = os.path.join(plugin_directory(project_path), "outputs.json")
+        self.lock = threading.Lock()
+        self.entries = {}
+        # Content hash of each file with the stamp it was taken at, so unchanged files are not read again
+        self.hashes = {}
+        self.stamp = None
+
+    def reload(self):
+        stamp = file_stamp(self.path)
+        if stamp != self.stamp:
+            data = read_json(self.path) or {}
+            self.entries = data.get("entries", {})
+            self.hashes.update(data.get("hashes", {}))
+            self.stamp = stamp
+
+    def write(self):
+        write_json(self.path, {"entries": self.entries, "hashes": self.hashes})
+        self.stamp = file_stamp(self.path)
+
+    def content_hash(self, path):
+        stamp = file_stamp(path)
+        known = self.hashes.get(path)
+        if known is not None and known[0] == stamp:
+            return known[1]
+        digest = file_hash(path)
+        self.hashes[path] = [stamp, digest]
+        return digest
+
+    def key(self, source, render_path, profile, stereo, dependencies):
+        relative = lambda path: os.path.relpath(path, self.project_path)
+        content = [relative(source), self.content_hash(source), os.path.basename(render_path), profile, stereo, \
+            [[relative(dependency), self.content_hash(dependency)] for dependency in sorted(dependencies)]]
+        return hashlib.sha1(json.dumps(content).encode("utf-8")).hexdigest()
+
+    def save(self, source, render_path, profile, stereo, dependencies):
+        if not output_files(render_path):
+            return
+        with self.lock, locked(self.path):
+            self.reload()
+            key = self.key(source, render_path, profile, stereo, dependencies)
+            entry = self.entries.get(key)
+            if entry is None or not output_files(entry["output"]):
+                target = os.path.join(self.root, key[:2], key, os.path.basename(render_path))
+                remove_output(target)
+                copy_output(render_path, target)
+                entry = {"source": source, "output": target, "size": output_size(target), "profile": profile, "stereo": stereo}
+                self.entries[key] = entry
+            entry["used"] = time.time()
+            self.evict(key)
+            self.write()
+
+    def evict(self, keep):
+        """Remove the least recently used outputs until the cache fits in limit, except keep"""
+        total = sum([entry["size"] for entry in self.entries.values()])
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["used"]):
+            if total <= self.limit:
+                break
+            if key == keep:
+                continue
+            remove_output(os.path.dirname(entry["output"]))
+            try:
+                os.rmdir(os.path.dirname(os.path.dirname(entry["output"])))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self.entries[key]
+
+    def restore(self, source, render_path, profile, stereo, dependencies):
+        """Copy the cached output for the current state of source into render_path, returns whether there was one"""
+        with self.lock:
+            self.reload()
+            key = self.key(source, render_path, profile, stereo, dependencies)
+            if key not in self.entries:
+                return False
+        with self.lock, locked(self.path):
+            self.reload()
+            entry = self.entries.get(key)
+            if entry is None or not output_files(entry["output"]):
+                return False
+            remove_output(render_path)
+            copy_output(entry["output"], render_path)
+            entry["used"] = time.time()
+            self.write()
+        return True
+
+class DependencyIndex():
+    """
+    Remembers, per project, the direct dependencies of each file together with
+    the mtime and size of their sources and renders at the last check, and of
+    the files each of them depends on in turn. A dependency whose recorded
+    stamps still match doesn't have to be checked again.
+    """
+    def __init__(self, project_path):
+        self.path = os.path.join(plugin_directory(project_path), "dependencies.json")
+        self.files = (read_json(self.path) or {}).get("files", {})
+
+    def get(self, path):
+        """The entry of path, kept when path is saved, as the records of its dependencies still hold"""
+        return self.files.get(path)
+
+    def listed(self, path):
+        """Whether the dependencies recorded for path are those of its current contents"""
+        entry = self.files.get(path)
+        return entry is not None and entry["stamp"] == file_stamp(path)
+
+    def changed(self, entry, dependencies=None):
+        """
+        Dependencies of an entry whose source or render changed since they were
+        recorded. Given the current list of dependencies, those the entry has no
+        record of count as changed too.
+        """
+        records = entry["dependencies"] if entry else {}
+        changed = []
+        for path in (records if dependencies is None else dependencies):
+            record = records.get(path)
+            if record is None or file_stamp(path) != record["stamp"] or output_stamp(record["render"]) != record["render_stamp"] \
+                    or any(file_stamp(source) != stamp for source, stamp in record.get("sources", {}).items()):
+                changed.append(path)
+        return changed
+
+    def update(self, path, results, dependencies=None):
+        """
+        results maps dependency paths to (render path, dirty, sources) tuples,
+        sources being the stamps of what the dependency depends on in turn.
+        Passing the current list of dependencies drops the records of those no
+        longer used.
+        """
+        entry = self.files.setdefault(path, {"stamp": None, "dependencies": {}})
+        if dependencies is not None:
+            entry["stamp"] = file_stamp(path)
+            entry["dependencies"] = dict([(dependency, record) for dependency, record in entry["dependencies"].items() \
+                if dependency in dependencies])
+        for dependency, (render, dirty, sources) in results.items():
+            entry["dependencies"][dependency] = {"stamp": file_stamp(dependency), "render": render, \
+                "render_stamp": output_stamp(render), "dirty": dirty, "sources": sources}
+        return entry
+
+    def dirty(self, path):
+        entry = self.files.get(path)
+        return entry is not None and any(dependency["dirty"] for dependency in entry["dependencies"].values())
+
+    def save(self):
+        write_json(self.path, {"files": self.files})
+
+class RenderManifest():
+    """
+    What the plug-in rendered in a project: for each source its stamp and hash,
+    the render path, profile, stereo mode, the stamps of its dependencies and
+    when it was rendered. Updates are merged into the file under a lock and
+    written atomically, so several Blender instances can share one project.
+    """
+    # Seconds between checks for updates made by other instances
+    reload_interval = 1.0
+
+    def __init__(self, project_path):
+        self.path = os.path.join(plugin_directory(project_path), "manifest.json")
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.renders = {}
+        self.stamp = None
+        self.checked = 0
+        self.reload()
+
+    def reload(self):
+        stamp = file_stamp(self.path)
+        if stamp != self.stamp:
+            self.load((read_json(self.path) or {}).get("sources", {}), stamp)
+
+    def load(self, entries, stamp):
+        self.entries = entries
+        self.renders = dict([(entry["render"], source) for source, entry in entries.items()])
+        self.stamp = stamp
+
+    def refresh(self):
+        now = time.time()
+        if now - self.checked >= self.reload_interval:
+            self.checked = now
+            with self.lock:
+                self.reload()
+
+    def source(self, render_path):
+        """The source that was rendered to render_path, if any"""
+        self.refresh()
+        return self.renders.get(render_path)
+
+    def current(self, source, profile, stereo):
+        """Whether the recorded render of source is still up to date"""
+        self.refresh()
+        entry = self.entries.get(source)
+        if entry is None or entry["profile"] != profile or entry["stereo"] != stereo:
+            return False
+        return file_stamp(entry["render"]) == entry["render_stamp"] and source_current(source, entry)
+
+    def dependencies(self, source):
+        """The stamps of the dependencies recorded with the render of source"""
+        entry = self.entries.get(source)
+        return dict(entry["dependencies"]) if entry else {}
+
+    def record(self, source, render_path, profile, stereo, dependencies):
+        entry = {
+            "stamp": file_stamp(source),
+            "hash": file_hash(source),
+            "render": render_path,
+            "render_stamp": file_stamp(render_path),
+            "profile": profile,
+            "stereo": stereo,
+            "dependencies": dict([(dependency, file_stamp(dependency)) for dependency in dependencies]),
+            "rendered": time.time()
+        }
+        with self.lock, locked(self.path):
+            # Merge with whatever other instances wrote in the meantime
+            entries = (read_json(self.path) or {}).get("sources", {})
+            entries[source] = entry
+            write_json(self.path, {"sources": entries})
+            self.load(entries, file_stamp(self.path))
@@ -0,0 +1,289 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from .capture import OutputSink
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+
+def renderchan_arguments(path, options, dependencies_only=False):
+    arguments = []
+    if options.get("profile", "default") != "default":
+        arguments += ["--profile", options["profile"]]
+    if options.get("stereo", "none") != "none":
+        arguments += ["--stereo", options["stereo"]]
+    if options.get("render_farm", "none") != "none":
+        arguments += ["--renderfarm", options["render_farm"]]
+        if options["render_farm"] == "afanasy" and options.get("cgru_location"):
+            arguments += ["--cgru-location", options["cgru_location"]]
+    if dependencies_only:
+        arguments.append("--deps")
+    arguments.append(path)
+    return arguments
+
+class Job():
+    def __init__(self, path, options, dependencies_only=False, on_finish=None, depends=None, after=None):
+        self.path = path
+        self.options = dict(options)
+        self.dependencies_only = dependencies_only
+        self.on_finish = on_finish
+        # Jobs that have to finish successfully before this one can start
+        self.depends = list(depends or [])
+        # Jobs that only have to be over before this one starts, however they ended
+        self.after = list(after or [])
+        self.status = PENDING
+        self.last_line = ""
+        # What the job printed, jobs that print nothing leave it empty
+        self.output = OutputSink()
+        self.started = None
+        self.ended = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def progress(self):
+        """Fraction of this job that is done, None if unknown"""
+        return 1.0 if self.finished else None
+
+    @property
+    def ready(self):
+        for job in self.depends:
+            if job.status != DONE:
+                return False
+        for job in self.after:
+            if not job.finished:
+                return False
+        return True
+
+    @property
+    def blocked(self):
+        for job in self.depends:
+            if job.status in (FAILED, CANCELLED):
+                return True
+        return False
+
+class ThreadJob(Job):
+    """
+    Runs function(job) on a background thread, for work done with RenderChan's
+    Python API rather than its command line. The return value ends up in result.
+    """
+    def __init__(self, path, function, on_finish=None, depends=None):
+        Job.__init__(self, path, {}, False, on_finish, depends)
+        self.function = function
+        self.result = None
+        self.outcome = FAILED
+        self.thread = None
+        self.cancelled = False
+
+    def start(self, command):
+        self.status = RUNNING
+        self.started = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.result = self.function(self)
+            self.outcome = DONE
+        except Exception as e:
+            self.last_line = str(e)
+            self.outcome = FAILED
+
+    def update(self):
+        if self.status != RUNNING or self.thread.is_alive():
+            return False
+        self.ended = time.time()
+        self.status = self.outcome
+        return True
+
+    def cancel(self):
+        if self.finished:
+            return False
+        # The function has to check job.cancelled itself, the thread is left to finish on its own
+        self.cancelled = True
+        self.status = CANCELLED
+        return True
+
+class RenderJob(Job):
+    """
+    A single RenderChan invocation. Jobs are run as separate processes so that
+    rendering never blocks Blender and can be cancelled at any time.
+    """
+    def __init__(self, path, options, dependencies_only=False, on_finish=None, depends=None, after=None):
+        Job.__init__(self, path, options, dependencies_only, on_finish, depends, after)
+        # Called with the job on the background thread before RenderChan is started, which is skipped if it returns True
+        self.reuse = None
+        # Called with the job on a background thread once RenderChan succeeded
+        self.on_success = None
+        # Optional rotating log file for everything RenderChan prints
+        self.log_path = None
+        self.returncode = None
+        self.process = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def start(self, command):
+        self.output = OutputSink(log_path=self.log_path)
+        self.status = RUNNING
+        self.started = time.time()
+        self.reader = threading.Thread(target=self.run, args=(command,), daemon=True)
+        self.reader.start()
+
+    @property
+    def progress(self):
+        if self.status == RUNNING:
+            return self.output.progress
+        return Job.progress.fget(self)
+
+    def run(self, command):
+        if self.reuse:
+            try:
+                if self.reuse(self):
+                    self.last_line = "Reused an earlier render of the same contents"
+                    self.returncode = 0
+                    return
+            except Exception as e:
+                self.last_line = str(e)
+        popen_args = {}
+        if os.name == "posix":
+            # Own process group, so cancelling also stops the renderers RenderChan spawned
+            popen_args["start_new_session"] = True
+        elif hasattr(subprocess, "CREATE_NEW_PROCESS_GROUP"):
+            popen_args["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        with self.lock:
+            if self.status != RUNNING:
+                return
+            try:
+                self.process = subprocess.Popen(command + renderchan_arguments(self.path, self.options, self.dependencies_only), \
+                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, **popen_args)
+            except OSError as e:
+                self.last_line = str(e)
+                return
+        self.read_output()
+
+    def read_output(self):
+        # Read in bounded pieces, so output without line breaks can't pile up
+        read = self.process.stdout.readline
+        while True:
+            data = read(OutputSink.line_limit)
+            if not data:
+                break
+            self.output.write(data)
+            self.last_line = self.output.last_line
+        self.output.close()
+        self.process.stdout.close()
+        self.returncode = self.process.wait()
+        if self.returncode == 0 and self.status == RUNNING and self.on_success:
+            try:
+                self.on_success(self)
+            except Exception as e:
+                self.last_line = str(e)
+
+    def update(self):
+        if self.status != RUNNING or self.reader.is_alive():
+            return False
+        self.ended = time.time()
+        self.status = DONE if self.returncode == 0 else FAILED
+        return True
+
+    def cancel(self):
+        if self.status == PENDING:
+            self.status = CANCELLED
+            return True
+        if self.status != RUNNING:
+            return False
+        with self.lock:
+            # A job still looking for an output to reuse never starts RenderChan
+            self.status = CANCELLED
+            process = self.process
+        if process is None:
+            return True
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGTERM)
+            else:
+                process.terminate()
+        except OSError:
+            pass
+        process.wait()
+        self.reader.join()
+        return True
+
+class JobQueue():
+    """
+    Runs RenderJobs in the background. Nothing here touches bpy: the caller is
+    expected to call poll() periodically from Blender's main thread and handle
+    the finished jobs it returns.
+    """
+    def __init__(self, command, workers=1):
+        self.command = command
+        self.workers = workers
+        self.jobs = []
+
+    def submit(self, job):
+        for queued in self.jobs:
+            if not queued.finished and type(queued) == type(job) and queued.path == job.path and queued.options == job.options \
+                    and queued.dependencies_only == job.dependencies_only:
+                return queued
+        self.jobs.append(job)
+        return job
+
+    @property
+    def active(self):
+        for job in self.jobs:
+            if not job.finished:
+                return True
+        return False
+
+    @property
+    def running(self):
+        return [job for job in self.jobs if job.status == RUNNING]
+
+    def progress(self):
+        if not self.jobs:
+            return 1.0
+        return sum([job.progress or 0.0 for job in self.jobs]) / len(self.jobs)
+
+    def poll(self):
+        finished = []
+        for job in self.running:
+            if job.update():
+                finished.append(job)
+        free = self.workers - len(self.running)
+        for job in self.jobs:
+            if job.status != PENDING:
+                continue
+            if job.blocked:
+                job.status = CANCELLED
+                job.last_line = "A dependency failed to render"
+                finished.append(job)
+                continue
+            if free <= 0 or not job.ready:
+                continue
+            try:
+                job.start(self.command)
+            except OSError as e:
+                job.status = FAILED
+                job.last_line = str(e)
+                finished.append(job)
+                continue
+            free -= 1
+        return finished
+
+    def cancel(self):
+        cancelled = []
+        for job in self.jobs:
+            if job.cancel():
+                cancelled.append(job)
+        return cancelled
+
+    def clear(self):
+        self.jobs = [job for job in self.jobs if not job.finished]
@@ -0,0 +1,111 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class Profiler():
+    """
+    Opt-in timing of the plug-in's hot paths. Phases and counters are collected
+    per run, a run being one operator or handler invocation, and every finished
+    run is appended to a JSON lines log. Work done outside of any run, such as
+    panel polls, only adds to the totals.
+    """
+    def __init__(self, history=20):
+        self.enabled = bool(os.environ.get("RENDERCHAN_PROFILE"))
+        self.log_path = os.environ.get("RENDERCHAN_PROFILE_LOG")
+        self.runs = deque(maxlen=history)
+        self.totals = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def current(self):
+        return getattr(self.local, "run", None)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        if self.current is not None:
+            counters = self.current["counters"]
+            counters[name] = counters.get(name, 0) + amount
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                total = self.totals.setdefault(name, [0, 0.0])
+                total[0] += 1
+                total[1] += elapsed
+            if self.current is not None:
+                phase = self.current["phases"].setdefault(name, [0, 0.0])
+                phase[0] += 1
+                phase[1] += elapsed
+
+    @contextmanager
+    def run(self, name):
+        if not self.enabled or self.current is not None:
+            yield
+            return
+        record = {"name": name, "started": time.time(), "phases": {}, "counters": {}}
+        self.local.run = record
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.local.run = None
+            record["duration"] = time.perf_counter() - start
+            self.record(record)
+
+    def record(self, record):
+        """Keep a finished run or job and append it to the log"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.runs.append(record)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a") as f:
+                        f.write(json.dumps(record, sort_keys=True) + "\n")
+                except OSError:
+                    self.log_path = None
+
+    def summary(self):
+        lines = []
+        for record in reversed(self.runs):
+            lines.append("%s: %.3fs" % (record["name"], record["duration"]))
+            for name, (calls, elapsed) in sorted(record.get("phases", {}).items(), key=lambda phase: -phase[1][1]):
+                lines.append("    %s: %.3fs in %d calls" % (name, elapsed, calls))
+            for name, amount in sorted(record.get("counters", {}).items()):
+                lines.append("    %s: %d" % (name, amount))
+        if self.counters:
+            lines.append("Totals")
+            for name, amount in sorted(self.counters.items()):
+                lines.append("    %s: %d" % (name, amount))
+            for name, (calls, elapsed) in sorted(self.totals.items()):
+                lines.append("    %s: %.3fs in %d calls" % (name, elapsed, calls))
+        return lines
+
+profiler = Profiler()
+
+def profiled(name):
+    """Decorator that records each call of the function as a run"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiler.run(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
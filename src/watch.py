@@ -0,0 +1,219 @@
+import errno
+import os
+import struct
+import time
+
+from .index import file_stamp
+
+# inotify(7) constants
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+event_header = struct.Struct("iIII")
+
+class PollingBackend():
+    """Notices changes by comparing the mtime and size of every watched file"""
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.stamps = {}
+        self.checked = 0
+
+    def add(self, path):
+        self.stamps[path] = file_stamp(path)
+
+    def remove(self, path):
+        self.stamps.pop(path, None)
+
+    def poll(self):
+        now = time.time()
+        if now - self.checked < self.interval:
+            return set()
+        self.checked = now
+        changed = set()
+        for path, stamp in self.stamps.items():
+            current = file_stamp(path)
+            if current != stamp:
+                self.stamps[path] = current
+                changed.add(path)
+        return changed
+
+    def close(self):
+        self.stamps = {}
+
+class InotifyBackend():
+    """
+    Uses Linux's inotify through ctypes. The directories of the watched files
+    are watched rather than the files themselves, so that programs saving to a
+    temporary file and renaming it over the original are noticed as well.
+    """
+    mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | \
+        IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    def __init__(self):
+        # Only loaded once watching starts, ctypes.util is slow to import
+        import ctypes
+        import ctypes.util
+        self.ctypes = ctypes
+        name = ctypes.util.find_library("c")
+        if name is None:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self.libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch descriptor per directory and the names watched in each
+        self.directories = {}
+        self.descriptors = {}
+        self.names = {}
+        # Files whose directory watch went away, for the caller to watch another way
+        self.lost = []
+
+    def add(self, path):
+        directory, name = os.path.split(path)
+        if directory not in self.directories:
+            descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.mask)
+            if descriptor < 0:
+                error = self.ctypes.get_errno()
+                raise OSError(error, "Could not watch %s: %s" % (directory, os.strerror(error)))
+            self.directories[directory] = descriptor
+            self.descriptors[descriptor] = directory
+            self.names[directory] = set()
+        self.names[directory].add(name)
+
+    def remove(self, path):
+        directory, name = os.path.split(path)
+        names = self.names.get(directory)
+        if names is None:
+            return
+        names.discard(name)
+        if not names:
+            descriptor = self.directories.pop(directory)
+            del self.descriptors[descriptor]
+            del self.names[directory]
+            self.libc.inotify_rm_watch(self.fd, descriptor)
+
+    def poll(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, cookie, length = event_header.unpack_from(data, offset)
+                offset += event_header.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost, treat everything as changed
+                    for directory, names in self.names.items():
+                        changed |= set([os.path.join(directory, name) for name in names])
+                    continue
+                directory = self.descriptors.get(descriptor)
+                if directory is None:
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    # The directory itself went away, every file in it changed
+                    paths = [os.path.join(directory, name) for name in self.names[directory]]
+                    changed |= set(paths)
+                    if mask & IN_IGNORED:
+                        self.lost += paths
+                        del self.directories[directory]
+                        del self.descriptors[descriptor]
+                        del self.names[directory]
+                elif name in self.names[directory]:
+                    changed.add(os.path.join(directory, name))
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.directories = {}
+        self.descriptors = {}
+        self.names = {}
+
+def make_backend():
+    try:
+        return InotifyBackend()
+    except (OSError, AttributeError):
+        return PollingBackend()
+
+class Watcher():
+    """
+    Watches a set of source files and reports those that changed once they
+    have been left alone for debounce seconds, so a burst of saves is
+    reported once. Files the backend can't watch, for example because their
+    directory doesn't exist yet, are polled instead.
+    """
+    def __init__(self, debounce=1.0, backend=None):
+        self.debounce = debounce
+        self.backend = backend or make_backend()
+        self.fallback = self.backend if isinstance(self.backend, PollingBackend) else PollingBackend()
+        self.paths = {}
+        # Time of the last change of each changed file not reported yet
+        self.pending = {}
+
+    @property
+    def kind(self):
+        return "inotify" if isinstance(self.backend, InotifyBackend) else "polling"
+
+    def watch(self, paths):
+        """Watch exactly paths from now on"""
+        paths = set(paths)
+        for path in set(self.paths) - paths:
+            self.paths.pop(path).remove(path)
+            self.pending.pop(path, None)
+        for path in paths - set(self.paths):
+            try:
+                self.backend.add(path)
+                self.paths[path] = self.backend
+            except OSError:
+                self.fallback.add(path)
+                self.paths[path] = self.fallback
+
+    def poll(self, hold=False):
+        """
+        Changed files that have settled, or nothing if hold is set. Changes
+        that arrive while holding are kept until the next poll without it.
+        """
+        now = time.time()
+        changed = self.backend.poll()
+        for path in getattr(self.backend, "lost", []):
+            if self.paths.get(path) is self.backend:
+                self.fallback.add(path)
+                self.paths[path] = self.fallback
+        if getattr(self.backend, "lost", None):
+            self.backend.lost = []
+        if self.fallback is not self.backend:
+            changed |= self.fallback.poll()
+        for path in changed:
+            if path in self.paths:
+                self.pending[path] = now
+        if hold:
+            return []
+        settled = sorted([path for path, changed in self.pending.items() if now - changed >= self.debounce])
+        for path in settled:
+            del self.pending[path]
+        return settled
+
+    def close(self):
+        self.backend.close()
+        if self.fallback is not self.backend:
+            self.fallback.close()
+        self.paths = {}
+        self.pending = {}
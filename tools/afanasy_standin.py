@@ -0,0 +1,147 @@
+"""
+A stand-in for the Afanasy server, for trying out farm rendering without a
+farm. It takes the JSON requests the plug-in sends, runs the blocks of each
+job in dependency order and reports their state.
+
+    python tools/afanasy_standin.py [--port 51000] [--run] [--task-time SECONDS] [--fail REGEX]
+
+By default tasks only pretend to render, taking --task-time seconds each.
+With --run their commands are really run on this machine. Blocks whose name
+matches --fail end in an error. Point the plug-in at it with
+AF_SERVERNAME=localhost and AF_SERVERPORT=<port>.
+"""
+import argparse
+import json
+import re
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+class Farm():
+    def __init__(self, run=False, task_time=1.0, fail=None, workers=4):
+        self.run = run
+        self.task_time = task_time
+        self.fail = re.compile(fail) if fail else None
+        self.workers = workers
+        self.jobs = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def submit(self, data):
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+            blocks = []
+            for block in data.get("blocks", []):
+                blocks.append({"name": block["name"], "state": "RDY", "depend_mask": block.get("depend_mask"), \
+                    "command": block["tasks"][0]["command"] if block.get("tasks") else "true"})
+            self.jobs[job_id] = {"id": job_id, "name": data.get("name", ""), "user_name": data.get("user_name", ""), "blocks": blocks}
+        print("Job %d: %s, %d blocks" % (job_id, data.get("name", ""), len(blocks)), flush=True)
+        return {"id": job_id, "name": data.get("name", "")}
+
+    def get(self, data):
+        with self.lock:
+            ids = data.get("ids") or list(self.jobs)
+            found = []
+            for job_id in ids:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                states = set([block["state"] for block in job["blocks"]])
+                state = "DON" if states == set(["DON"]) else " ".join(sorted(states))
+                found.append({"id": job["id"], "name": job["name"], "state": state, \
+                    "blocks": [{"name": block["name"], "state": block["state"]} for block in job["blocks"]]})
+            return {"jobs": found}
+
+    def action(self, data):
+        if data.get("operation", {}).get("type") == "delete":
+            with self.lock:
+                for job_id in data.get("ids", []):
+                    if self.jobs.pop(job_id, None) is not None:
+                        print("Job %d deleted" % job_id, flush=True)
+        return {}
+
+    def schedule(self):
+        """Start the blocks whose dependencies are done, forever"""
+        while True:
+            with self.lock:
+                running = sum([1 for job in self.jobs.values() for block in job["blocks"] if block["state"] == "RUN"])
+                for job in self.jobs.values():
+                    for block in job["blocks"]:
+                        if running >= self.workers:
+                            break
+                        if block["state"] not in ("RDY", "WDP"):
+                            continue
+                        mask = re.compile(block["depend_mask"]) if block["depend_mask"] else None
+                        depends = [other for other in job["blocks"] if mask and other is not block and mask.match(other["name"])]
+                        if any(other["state"] != "DON" for other in depends):
+                            block["state"] = "WDP"
+                            continue
+                        block["state"] = "RUN"
+                        running += 1
+                        threading.Thread(target=self.render, args=(block,), daemon=True).start()
+            time.sleep(0.2)
+
+    def render(self, block):
+        print("Rendering %s" % block["name"], flush=True)
+        if self.run:
+            ok = subprocess.call(block["command"], shell=True) == 0
+        else:
+            time.sleep(self.task_time)
+            ok = True
+        if self.fail and self.fail.search(block["name"]):
+            ok = False
+        with self.lock:
+            block["state"] = "DON" if ok else "ERR"
+        print("%s %s" % ("Rendered" if ok else "Failed", block["name"]), flush=True)
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def handler(farm):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+                if "job" in data:
+                    reply = farm.submit(data["job"])
+                elif "get" in data:
+                    reply = farm.get(data["get"])
+                elif "action" in data:
+                    reply = farm.action(data["action"])
+                else:
+                    reply = {"error": "Unknown request"}
+            except (ValueError, KeyError) as e:
+                reply = {"error": str(e)}
+            body = json.dumps(reply).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Afanasy server for testing farm rendering.")
+    parser.add_argument("--port", type=int, default=51000)
+    parser.add_argument("--run", action="store_true", help="Really run the task commands")
+    parser.add_argument("--task-time", type=float, default=1.0, help="Seconds a pretend task takes")
+    parser.add_argument("--fail", help="Blocks whose name matches this regular expression fail")
+    parser.add_argument("--workers", type=int, default=4, help="How many tasks run at the same time")
+    arguments = parser.parse_args()
+    farm = Farm(arguments.run, arguments.task_time, arguments.fail, arguments.workers)
+    threading.Thread(target=farm.schedule, daemon=True).start()
+    server = ThreadingServer(("", arguments.port), handler(farm))
+    print("Afanasy stand-in listening on port %d" % arguments.port, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()